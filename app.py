@@ -32,4 +32,23 @@ with app.app_context():
     # Import routes to register all endpoints
     import routes  # noqa: F401
 
-    db.create_all()
\ No newline at end of file
+    db.create_all()
+
+    # Register maintenance CLI commands; index upgrades run from `flask upgrade-db`, not at boot
+    import chat_maintenance
+    chat_maintenance.check_schema()
+
+    # Finish purging sessions cleared before a restart
+    chat_maintenance.get_session_purger()
+
+# Expire job workspaces in the background, even while no new jobs arrive
+from job_workspace import get_workspace_manager
+get_workspace_manager()
+
+# Heavy services load on first use; optionally warm some in the background once serving
+from service_registry import prewarm_from_env
+prewarm_from_env()
+
+# Load and warm the CSM model in the background so no request pays for it
+import csm_warmup
+csm_warmup.start_from_env()
\ No newline at end of file
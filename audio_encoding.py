@@ -0,0 +1,101 @@
+"""
+In-memory audio encoders for speech responses
+Turns 16-bit mono PCM into WAV, Opus or MP3 bytes without touching the
+filesystem; compressed formats are piped through an ffmpeg subprocess
+"""
+import os
+import time
+import struct
+import logging
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_ENCODE_TIMEOUT = float(os.environ.get('AUDIO_ENCODE_TIMEOUT', 30))
+
+
+class AudioEncodingError(RuntimeError):
+    """Raised when an encoder fails or is not available"""
+
+
+@dataclass
+class EncodedAudio:
+    data: bytes
+    format: str
+    mimetype: str
+    encode_ms: float
+
+
+class AudioEncoder:
+    """Encodes 16-bit little-endian mono PCM into one container format"""
+    mimetype = 'application/octet-stream'
+
+    def encode(self, pcm: bytes, sample_rate: int) -> bytes:
+        raise NotImplementedError
+
+
+class WavEncoder(AudioEncoder):
+    """RIFF header + the PCM as-is; the only copy is the final join"""
+    mimetype = 'audio/wav'
+
+    def encode(self, pcm: bytes, sample_rate: int) -> bytes:
+        header = (
+            b'RIFF' + struct.pack('<I', 36 + len(pcm)) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b'data' + struct.pack('<I', len(pcm))
+        )
+        return b''.join((header, pcm))
+
+
+class FFmpegEncoder(AudioEncoder):
+    """Pipes PCM through ffmpeg's stdin and reads the encoded stream from stdout"""
+
+    def __init__(self, mimetype: str, output_args: List[str]):
+        self.mimetype = mimetype
+        self.output_args = output_args
+
+    def encode(self, pcm: bytes, sample_rate: int) -> bytes:
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+            *self.output_args, 'pipe:1'
+        ]
+        try:
+            result = subprocess.run(cmd, input=pcm, capture_output=True, timeout=FFMPEG_ENCODE_TIMEOUT)
+        except FileNotFoundError:
+            raise AudioEncodingError('ffmpeg is not installed')
+        except subprocess.TimeoutExpired:
+            raise AudioEncodingError(f'ffmpeg encode timed out after {FFMPEG_ENCODE_TIMEOUT}s')
+        if result.returncode != 0:
+            raise AudioEncodingError(result.stderr.decode('utf-8', 'replace').strip()[-500:])
+        return result.stdout
+
+
+ENCODERS: Dict[str, AudioEncoder] = {
+    'wav': WavEncoder(),
+    'opus': FFmpegEncoder('audio/ogg', [
+        '-c:a', 'libopus', '-b:a', os.environ.get('OPUS_BITRATE', '32k'), '-f', 'ogg'
+    ]),
+    'mp3': FFmpegEncoder('audio/mpeg', [
+        '-c:a', 'libmp3lame', '-b:a', os.environ.get('MP3_BITRATE', '64k'), '-f', 'mp3'
+    ]),
+}
+
+
+def register_encoder(name: str, encoder: AudioEncoder):
+    """Add or replace the encoder used for a format name"""
+    ENCODERS[name] = encoder
+
+
+def encode_audio(pcm: bytes, sample_rate: int, audio_format: str = 'wav') -> EncodedAudio:
+    """Encode PCM into audio_format, timing the encode"""
+    encoder = ENCODERS.get(audio_format)
+    if encoder is None:
+        raise AudioEncodingError(f"Unsupported audio format: {audio_format}")
+
+    start = time.perf_counter()
+    data = encoder.encode(pcm, sample_rate)
+    encode_ms = (time.perf_counter() - start) * 1000
+    return EncodedAudio(data=data, format=audio_format, mimetype=encoder.mimetype, encode_ms=encode_ms)
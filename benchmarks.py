@@ -0,0 +1,752 @@
+"""
+Performance benchmarks for SQUAD ONE services
+Run one with: python benchmarks.py <name>   (python benchmarks.py --list shows all)
+"""
+import os
+import sys
+import math
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+import argparse
+import threading
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def run_clients(call, clients, requests_per_client):
+    """Fire `call(i)` from `clients` threads and return (requests/sec, latencies in ms)"""
+    latencies = []
+    latencies_lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client(client_id):
+        barrier.wait()
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            call(client_id * requests_per_client + i)
+            elapsed = (time.perf_counter() - start) * 1000
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return len(latencies) / wall, latencies
+
+
+class StubCSMGenerator:
+    """
+    Stands in for load_csm_1b with a fixed cost model
+
+    A generation costs base + per-char time. It has no frame-level model, so
+    the agent runs batches from it one request at a time.
+    """
+    sample_rate = 24000
+
+    def __init__(self, base_ms=40.0, per_char_ms=0.5):
+        self.base_ms = base_ms
+        self.per_char_ms = per_char_ms
+        self.calls = 0
+
+    def _audio(self, text):
+        import torch
+        return torch.zeros(len(text) * 240)
+
+    def generate(self, text, speaker, context, max_audio_length_ms=90_000, temperature=0.9, topk=50):
+        self.calls += 1
+        time.sleep((self.base_ms + self.per_char_ms * len(text)) / 1000)
+        return self._audio(text)
+
+    def generate_stream(self, text, speaker, context, max_audio_length_ms=90_000, temperature=0.9, topk=50):
+        self.calls += 1
+        frames = max(1, len(text) // 4)
+        for _ in range(frames):
+            time.sleep(self.per_char_ms * 4 / 1000)
+            yield self._audio('x' * 8)
+
+
+BENCH_SENTENCES = [
+    "Hello! I'm BERYL from SQUAD ONE.",
+    "How can I help you today?",
+    "I can help you deploy your applications to multiple platforms.",
+    "What aspect of avatar development are you working on?",
+]
+
+
+def bench_csm_batching(args):
+    """
+    Requests/sec and p95 latency of direct vs micro-batched CSM generation
+
+    Runs the real CSM checkpoint; both modes share one loaded agent. With
+    --stub a fixed-cost stand-in is used instead, which has no batched
+    kernel, so that run only measures the scheduler's own overhead.
+    """
+    from csm_integration import CSMVoiceAgent
+    from csm_batching import CSMBatchScheduler
+
+    if args.stub:
+        print("stub generator: batches run item by item, so this measures scheduling overhead only")
+        agent = CSMVoiceAgent(generator=StubCSMGenerator())
+    else:
+        agent = CSMVoiceAgent()
+        if not agent.is_available():
+            sys.exit(f"CSM not available ({agent.error}); use --stub to measure scheduler overhead only")
+        print(f"CSM on {agent.device} ({agent.runtime.cpu_mode})")
+
+    print(f"{'clients':>8} {'mode':>8} {'req/s':>10} {'p95 ms':>10}")
+    for clients in (1, 4, 16):
+        direct = agent
+        batched = CSMBatchScheduler(agent, max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+        modes = {
+            'direct': lambda i: direct.generate_speech(BENCH_SENTENCES[i % len(BENCH_SENTENCES)]),
+            'batched': lambda i: batched.generate_speech(BENCH_SENTENCES[i % len(BENCH_SENTENCES)]),
+        }
+        for mode, call in modes.items():
+            rate, latencies = run_clients(call, clients, args.requests)
+            print(f"{clients:>8} {mode:>8} {rate:>10.1f} {percentile(latencies, 95):>10.1f}")
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _media_duration(path):
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip())
+
+
+def bench_lipsync_modes(args):
+    """Wall time and CPU seconds per output second for two-pass vs single-pass lip-sync"""
+    import instant_lipsync
+
+    workdir = tempfile.mkdtemp(prefix='lipsync-bench-')
+    try:
+        source = os.path.join(workdir, 'sync.mp4')
+        voice = os.path.join(workdir, 'voice.wav')
+        subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30",
+                        "-t", "4", "-pix_fmt", "yuv420p", source], check=True, capture_output=True)
+        subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=220:sample_rate=22050",
+                        "-t", "2", voice], check=True, capture_output=True)
+        instant_lipsync.MOUTH_CACHE_DIR = os.path.join(workdir, 'cache')
+
+        print(f"{'mode':>12} {'cache':>6} {'wall s/out s':>14} {'cpu s/out s':>14}")
+        for mode in instant_lipsync.PIPELINE_MODES:
+            for cache in ('cold', 'warm'):
+                wall_total = cpu_total = output_total = 0.0
+                for i in range(args.requests):
+                    if cache == 'cold':
+                        shutil.rmtree(instant_lipsync.MOUTH_CACHE_DIR, ignore_errors=True)
+                    elif i == 0:
+                        instant_lipsync.cached_mouth_crop(source)
+
+                    output = os.path.join(workdir, f'out_{mode}_{cache}_{i}.mp4')
+                    cpu_start = _children_cpu_seconds()
+                    start = time.perf_counter()
+                    instant_lipsync.lipsync(voice, output, mode=mode, source_video=source)
+                    wall_total += time.perf_counter() - start
+                    cpu_total += _children_cpu_seconds() - cpu_start
+                    output_total += _media_duration(output)
+
+                print(f"{mode:>12} {cache:>6} {wall_total / output_total:>14.3f} {cpu_total / output_total:>14.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _synthetic_intents(count):
+    from intent_matcher import DEFAULT_INTENTS
+
+    intents = list(DEFAULT_INTENTS[:count])
+    for i in range(len(intents), count):
+        intents.append({
+            'name': f'topic{i}',
+            'keywords': [f'topic{i}', f'subject{i}', f'area of {i}'],
+            'response': f'Response for topic {i}.'
+        })
+    return intents
+
+
+def bench_intent_matcher(args):
+    """Per-call latency of the compiled intent matcher vs linear keyword scans"""
+    from intent_matcher import IntentMatcher
+
+    corpus = [
+        "Hello there, can you help me?",
+        "I want to build an agent that summarises my inbox every morning",
+        "What is the best way to handle hosting for a Flask app with a Postgres database?",
+        "Tell me about the weather in a place I have never visited before and probably never will",
+        "Can the avatar animation keep up with fast speech?",
+        "Let's talk about topic999 and subject500 in some depth please",
+    ] * 50
+
+    print(f"{'intents':>8} {'linear us/call':>16} {'compiled us/call':>18}")
+    for count in (4, 100, 1000):
+        intents = _synthetic_intents(count)
+        matcher = IntentMatcher(intents)
+
+        def linear(message):
+            for intent in intents:
+                if any(word in message.lower() for word in intent['keywords']):
+                    return intent['response']
+            return None
+
+        timings = {}
+        for name, func in (('linear', linear), ('compiled', matcher.respond)):
+            start = time.perf_counter()
+            for message in corpus:
+                func(message)
+            timings[name] = (time.perf_counter() - start) / len(corpus) * 1_000_000
+
+        print(f"{count:>8} {timings['linear']:>16.1f} {timings['compiled']:>18.1f}")
+
+
+def _load_app(database_url=None):
+    """Import the Flask app against a benchmark database (a temp SQLite file by default)"""
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    elif 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='chat-bench-'), 'bench.db')
+    from app import app, db
+    return app, db
+
+
+def bench_chat_turns(args):
+    """Chat turns/sec: two commits per turn vs single-transaction and batched turn writers"""
+    app, db = _load_app(args.database_url)
+    from models import ChatMessage
+    from chat_persistence import ChatTurnWriter
+
+    def legacy_turn(session_id):
+        for role in ('user', 'assistant'):
+            msg = ChatMessage()
+            msg.session_id = session_id
+            msg.role = role
+            msg.content = 'benchmark message ' * 8
+            db.session.add(msg)
+            db.session.commit()
+
+    writers = {
+        'transaction': ChatTurnWriter(app, mode='transaction'),
+        'batched': ChatTurnWriter(app, mode='batched'),
+    }
+    modes = {'two-commit': legacy_turn}
+    for mode, writer in writers.items():
+        modes[mode] = lambda session_id, writer=writer: writer.write_turn(
+            session_id, 'benchmark message ' * 8, 'benchmark message ' * 8
+        )
+
+    print(f"database: {db.engine.dialect.name}")
+    print(f"{'clients':>8} {'mode':>12} {'turns/s':>10} {'p95 ms':>10}")
+    for clients in (1, 8):
+        for mode, turn in modes.items():
+            def call(i, turn=turn):
+                with app.app_context():
+                    turn(f'bench-{mode}-{i % clients}')
+            rate, latencies = run_clients(call, clients, args.requests)
+            print(f"{clients:>8} {mode:>12} {rate:>10.1f} {percentile(latencies, 95):>10.1f}")
+
+
+HEAVY_MODULES = ('torch', 'torchaudio', 'gradio', 'transformers', 'generator')
+
+
+def bench_startup(args):
+    """Cold `import app` time, slowest imports, and a check that no heavy module loads at boot"""
+    env = dict(os.environ, SERVICE_PREWARM='', CSM_WARMUP='0')
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='startup-bench-'), 'bench.db'))
+
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit("import app failed")
+
+    # stderr lines: "import time: <self us> | <cumulative us> | <indented module>"
+    imports = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports[module.strip()] = int(cumulative)
+
+    print(f"import app: {wall:.2f}s wall, {len(imports)} modules")
+    for module, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:15]:
+        print(f"{cumulative / 1000:>10.1f} ms  {module}")
+
+    loaded = [module for module in HEAVY_MODULES if module in imports]
+    print(f"heavy modules imported at startup: {', '.join(loaded) or 'none'}")
+    assert not loaded, f"startup imported {loaded}; load these through service_registry instead"
+
+
+def bench_singleton_init(args):
+    """32 simultaneous first requests for a slow service: unsynchronized getter vs LazySingleton"""
+    from service_registry import ServiceRegistry
+
+    clients = 32
+    loads = []
+
+    def slow_load():
+        loads.append(threading.get_ident())
+        time.sleep(0.5)  # stands in for load_csm_1b
+        return object()
+
+    holder = {'agent': None}
+
+    def unsynchronized():
+        # The check-then-create getter this replaced
+        if holder['agent'] is None:
+            holder['agent'] = slow_load()
+        return holder['agent']
+
+    # A local registry, reached as the routes reach theirs (tests/test_lazy_singleton.py checks the single load)
+    registry = ServiceRegistry()
+    registry.register('csm', slow_load)
+
+    print(f"{clients} concurrent first requests")
+    print(f"{'getter':>16} {'loads':>6} {'instances':>10} {'max ms':>8}")
+    for name, getter in (('unsynchronized', unsynchronized), ('lazy-singleton', lambda: registry.get('csm'))):
+        del loads[:]
+        barrier = threading.Barrier(clients)
+        results = [None] * clients
+        latencies = []
+
+        def client(index):
+            barrier.wait()
+            start = time.perf_counter()
+            results[index] = getter()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        instances = len({id(result) for result in results})
+        print(f"{name:>16} {len(loads):>6} {instances:>10} {max(latencies):>8.1f}")
+
+
+def _write_tone_wav(path, seconds=10, sample_rate=44100):
+    """Mono 16-bit sine clip standing in for a speaker reference recording"""
+    import wave
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        frames += int(8000 * math.sin(2 * math.pi * 220 * i / sample_rate)).to_bytes(2, 'little', signed=True)
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(frames))
+
+
+def bench_voice_prompts(args):
+    """Building a context segment from a 10s 44.1kHz clip: decode+resample every time vs registry lookup"""
+    import torchaudio
+    from csm_integration import CSMVoiceAgent, Segment
+    from voice_prompts import VoicePromptRegistry
+
+    workdir = tempfile.mkdtemp(prefix='voice-bench-')
+    clip = os.path.join(workdir, 'speaker.wav')
+    _write_tone_wav(clip)
+    agent = CSMVoiceAgent(generator=StubCSMGenerator())
+
+    def uncached():
+        audio, rate = torchaudio.load(clip)
+        audio = torchaudio.functional.resample(audio.squeeze(0), orig_freq=rate, new_freq=agent.sample_rate)
+        return Segment(speaker=0, text='reference', audio=audio)
+
+    registries = {
+        'registry (memory)': VoicePromptRegistry(cache_dir=None, use_mmap=False),
+        'registry (mmap)': VoicePromptRegistry(cache_dir=os.path.join(workdir, 'prompts'), use_mmap=True),
+    }
+    candidates = [('decode+resample', uncached)] + [
+        (name, lambda registry=registry: registry.get_segment('reference', 0, clip, agent.sample_rate))
+        for name, registry in registries.items()
+    ]
+
+    print(f"{'method':>18} {'first ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, build in candidates:
+        start = time.perf_counter()
+        build()
+        first = (time.perf_counter() - start) * 1000
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            build()
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:>18} {first:>9.2f} {percentile(latencies, 50):>9.3f} {percentile(latencies, 95):>9.3f}")
+
+    # A second process (here: a fresh registry) maps the published array instead of decoding
+    second = VoicePromptRegistry(cache_dir=os.path.join(workdir, 'prompts'), use_mmap=True)
+    start = time.perf_counter()
+    second.get_segment('reference', 0, clip, agent.sample_rate)
+    print(f"second process first lookup: {(time.perf_counter() - start) * 1000:.2f} ms, stats {second.get_stats()}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _csm_cpu_run(cpu_mode, threads, compile_model, sentences):
+    """One CSM CPU mode in this process: print RTF and peak RSS as JSON"""
+    import json
+    from csm_integration import CSMVoiceAgent
+    from csm_runtime import CSMRuntimeConfig
+
+    runtime = CSMRuntimeConfig(device='cpu', cpu_mode=cpu_mode, threads=threads, compile=compile_model)
+    start = time.perf_counter()
+    agent = CSMVoiceAgent(runtime=runtime)
+    load_seconds = time.perf_counter() - start
+    if not agent.is_available():
+        print(json.dumps({'error': agent.error}))
+        return
+
+    agent.generate_speech(BENCH_SENTENCES[0], max_duration_ms=2000)  # warm-up, not timed
+    generated_seconds = audio_seconds = 0.0
+    for text in BENCH_SENTENCES[:sentences]:
+        start = time.perf_counter()
+        audio = agent.generate_speech(text, max_duration_ms=10000, temperature=0.9)
+        generated_seconds += time.perf_counter() - start
+        audio_seconds += len(audio) / agent.sample_rate
+
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'rtf': generated_seconds / audio_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def bench_csm_cpu_modes(args):
+    """CSM on CPU: real-time factor and peak RSS for bf16 (as loaded), fp32, int8, and fp32/int8 with torch.compile"""
+    import json
+
+    sentences = min(args.requests, len(BENCH_SENTENCES))
+    threads = args.threads or (os.cpu_count() or 1)
+    modes = [('bf16', False), ('fp32', False), ('int8', False), ('fp32', True), ('int8', True)]
+
+    print(f"{sentences} fixed sentences, {threads} threads, one fresh process per mode (RTF < 1 is faster than real time)")
+    print(f"{'mode':>14} {'load s':>8} {'RTF':>7} {'peak RSS MB':>12}")
+    for cpu_mode, compile_model in modes:
+        code = (f"import benchmarks; benchmarks._csm_cpu_run({cpu_mode!r}, {threads}, "
+                f"{compile_model}, {sentences})")
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        name = cpu_mode + ('+compile' if compile_model else '')
+        lines = proc.stdout.strip().splitlines()
+        result = json.loads(lines[-1]) if lines else {'error': proc.stderr.strip()[-300:]}
+        if 'error' in result:
+            print(f"{name:>14} failed: {result['error']}")
+            continue
+        print(f"{name:>14} {result['load_seconds']:>8.1f} {result['rtf']:>7.2f} {result['peak_rss_mb']:>12.0f}")
+
+
+def _start_stub_http_server(flaky_every=0):
+    """
+    Local keep-alive HTTP server standing in for the HuggingFace inference API
+
+    Answers POSTs with a small JPEG after 5ms; with flaky_every=n every nth
+    request gets a 503 "model loading". Counts accepted TCP connections.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stats = {'connections': 0, 'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats['connections'] += 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            with lock:
+                stats['requests'] += 1
+                count = stats['requests']
+            time.sleep(0.005)
+            if flaky_every and count % flaky_every == 0:
+                body, status, content_type = b'{"error": "Model is currently loading"}', 503, 'application/json'
+            else:
+                body, status, content_type = b'\xff\xd8stub-jpeg\xff\xd9', 200, 'image/jpeg'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def bench_http_pool(args):
+    """Face-swap API calls against a local stub: requests.post per call vs the pooled retrying client"""
+    import requests
+    from http_client import CircuitOpenError, PooledHTTPClient
+
+    clients = 16
+    payload = {'inputs': {'source_image': 'x' * 50_000, 'expression': 'moderate smile'}}
+
+    print(f"{clients} clients x {args.requests} requests, 5ms server time")
+    print(f"{'client':>22} {'req/s':>8} {'p95 ms':>8} {'ok':>6} {'connections':>12}")
+    for flaky_every in (0, 5):
+        for name in ('requests.post', 'pooled'):
+            server, stats = _start_stub_http_server(flaky_every)
+            url = f"http://127.0.0.1:{server.server_address[1]}/models/stub"
+            pooled = PooledHTTPClient(pool_size=clients, backoff=0.01, breaker_failures=1000)
+            ok = []
+
+            def call(index):
+                if name == 'requests.post':
+                    response = requests.post(url, json=payload, timeout=15)
+                else:
+                    response = pooled.post(url, json=payload)
+                if response.status_code == 200:
+                    ok.append(1)
+
+            throughput, latencies = run_clients(call, clients, args.requests)
+            label = f"{name}{' (20% 503)' if flaky_every else ''}"
+            print(f"{label:>22} {throughput:>8.1f} {percentile(latencies, 95):>8.1f} "
+                  f"{len(ok):>6} {stats['connections']:>12}")
+            server.shutdown()
+            server.server_close()
+
+    # Circuit breaking: a host that only returns 503 is cut off after a few failures
+    server, stats = _start_stub_http_server(flaky_every=1)
+    url = f"http://127.0.0.1:{server.server_address[1]}/models/stub"
+    pooled = PooledHTTPClient(max_retries=0, breaker_failures=5, breaker_reset_seconds=60)
+    rejected = 0
+    for _ in range(50):
+        try:
+            pooled.post(url, json=payload)
+        except CircuitOpenError:
+            rejected += 1
+    print(f"always-503 host: 50 calls, {stats['requests']} reached the server, {rejected} rejected by the open circuit")
+    server.shutdown()
+    server.server_close()
+
+
+class _StubImageResponse:
+    """What the HuggingFace face API returns for one frame"""
+    status_code = 200
+    headers = {'content-type': 'image/jpeg'}
+
+    def __init__(self, content):
+        self.content = content
+
+
+class StubFaceHTTPClient:
+    """Answers face-swap API posts with a fixed JPEG after serializing the JSON body as requests would"""
+
+    def __init__(self, jpeg):
+        self.jpeg = jpeg
+        self.request_bytes = 0
+        self._lock = threading.Lock()  # posts arrive from the render pool
+
+    def post(self, url, headers=None, json=None):
+        import json as json_module
+        size = len(json_module.dumps(json))
+        with self._lock:
+            self.request_bytes += size
+        return _StubImageResponse(bytes(bytearray(self.jpeg)))  # a fresh buffer, as each HTTP response is
+
+    def get_stats(self):
+        return {}
+
+
+def _base64_face_timeline(avatar_path, timeline, http, workers=8):
+    """
+    Reference for the original face-swap pipeline, which kept every image as a base64 string
+
+    The full-size avatar is base64-encoded once and sent in every render request,
+    each response is base64-encoded on arrival, and the JSON body embeds those strings.
+    Returns (response body size, request bytes).
+    """
+    import base64
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+
+    with open(avatar_path, 'rb') as f:
+        source_face = base64.b64encode(f.read()).decode('utf-8')
+
+    def render(key):
+        phoneme, intensity = key
+        payload = {'inputs': {'source_image': source_face, 'expression': f"neutral_{phoneme}", 'intensity': intensity},
+                   'parameters': {'num_inference_steps': 20, 'guidance_scale': 7.5, 'output_format': 'jpeg'}}
+        response = http.post('https://face-swap.invalid', headers={}, json=payload)
+        return base64.b64encode(response.content).decode('utf-8')
+
+    keys = list(dict.fromkeys((entry['phoneme'], entry['intensity']) for entry in timeline))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rendered = dict(zip(keys, pool.map(render, keys)))
+    body = json.dumps({'success': True, 'frames': [
+        {**entry, 'index': index, 'image': rendered[(entry['phoneme'], entry['intensity'])]}
+        for index, entry in enumerate(timeline)
+    ]})
+    return len(body), http.request_bytes
+
+
+def bench_face_frames(args):
+    """1000-frame face-swap timeline: base64 strings (reference baseline) vs bytes with JSON or multipart responses"""
+    import io
+    import tracemalloc
+    from PIL import Image
+    from service_registry import services
+    from face_backends import HuggingFaceFaceBackend
+    from face_swap_service import FaceSwapService, PHONEME_EXPRESSIONS
+    import viseme_atlas
+
+    app, _ = _load_app(args.database_url)
+    os.environ.setdefault('HUGGINGFACE_TOKEN', 'bench')
+    frames = 1000
+    workdir = tempfile.mkdtemp(prefix='face-bench-')
+    source = Image.frombytes('RGB', (1024, 1024), os.urandom(1024 * 1024 * 3))
+    avatar_path = os.path.join(workdir, 'avatar.jpg')
+    source.save(avatar_path, format='JPEG', quality=92)
+    with open(avatar_path, 'rb') as f:
+        avatar = f.read()
+    buffer = io.BytesIO()
+    source.resize((512, 512)).save(buffer, format='JPEG', quality=85)
+    response_jpeg = buffer.getvalue()
+
+    # Distinct (phoneme, intensity) per entry so every frame is a backend render rather than a shared one
+    phonemes = [phoneme for phoneme in PHONEME_EXPRESSIONS]
+    timeline = [{'phoneme': phonemes[index % len(phonemes)], 'intensity': (index // len(phonemes)) / 100}
+                for index in range(frames)]
+
+    def empty_atlas():
+        # No atlas frames, so the build renders nothing and every timeline frame goes through the backend
+        return viseme_atlas.VisemeAtlasStore(root=os.path.join(workdir, 'atlas'), emotions=())
+
+    def current(response_format):
+        http = StubFaceHTTPClient(response_jpeg)
+        service = FaceSwapService(backend=HuggingFaceFaceBackend(http_client=http), atlas=empty_atlas())
+        service.avatar_dir = os.path.join(workdir, 'avatars')
+        service.initialize()
+        services.register('face_swap', lambda: service)
+        client = app.test_client()
+        uploaded = client.post('/api/face-swap/avatar', data={'image': (io.BytesIO(avatar), 'avatar.jpg')})
+        assert uploaded.status_code == 200, uploaded.get_json()
+        response = client.post('/api/face-swap', json={'timeline': timeline, 'emotion': 'neutral',
+                                                       'avatar_id': uploaded.get_json()['avatar_id'],
+                                                       'format': response_format}, buffered=False)
+        assert response.status_code == 200, response.get_data(as_text=True)[:200]
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size, http.request_bytes
+
+    pipelines = [('base64 strings', lambda: _base64_face_timeline(avatar_path, timeline,
+                                                                  StubFaceHTTPClient(response_jpeg))),
+                 ('bytes, json response', lambda: current('json')),
+                 ('bytes, multipart', lambda: current('multipart'))]
+
+    print(f"{frames} frames through the huggingface backend (stub HTTP), "
+          f"{len(response_jpeg) // 1024} KB per frame, {len(avatar) // 1024} KB avatar upload")
+    print(f"{'pipeline':>28} {'CPU us/frame':>13} {'peak MB':>8} {'request MB':>11} {'response MB':>12}")
+    for name, pipeline in pipelines:
+        tracemalloc.start()
+        cpu = time.process_time()
+        response_bytes, request_bytes = pipeline()
+        cpu = time.process_time() - cpu
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>28} {cpu / frames * 1e6:>13.1f} {peak / 2**20:>8.1f} "
+              f"{request_bytes / 2**20:>11.1f} {response_bytes / 2**20:>12.1f}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_face_backends(args):
+    """Per-frame latency of the local CPU face backend on a synthetic 512px avatar"""
+    import io
+    import hashlib
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from face_backends import SourceFace, LocalWarpFaceBackend, VISEME_SHAPES, EMOTION_SHAPES
+
+    size = 512
+    image = Image.new('RGB', (size, size), (224, 180, 150))
+    ImageDraw.Draw(image).ellipse((190, 345, 322, 393), fill=(180, 60, 60))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    jpeg = buffer.getvalue()
+    source = SourceFace(image=np.asarray(image), jpeg=jpeg, b64='', hash=hashlib.sha256(jpeg).hexdigest())
+
+    backend = LocalWarpFaceBackend()
+    combos = [(phoneme, emotion) for phoneme in VISEME_SHAPES for emotion in EMOTION_SHAPES]
+    frames = 1000
+    latencies = []
+    for index in range(frames):
+        phoneme, emotion = combos[index % len(combos)]
+        start = time.perf_counter()
+        backend.render(source, phoneme, emotion, 0.5)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(f"{frames} frames at {size}x{size}, {len(combos)} viseme/emotion combinations")
+    print(f"p50 {percentile(latencies, 50):.2f} ms  p95 {percentile(latencies, 95):.2f} ms  "
+          f"max {max(latencies):.2f} ms  ({frames * 1000 / sum(latencies):.0f} frames/s)")
+
+
+BENCHMARKS = {
+    'csm-batching': bench_csm_batching,
+    'lipsync-modes': bench_lipsync_modes,
+    'intent-matcher': bench_intent_matcher,
+    'chat-turns': bench_chat_turns,
+    'startup': bench_startup,
+    'singleton-init': bench_singleton_init,
+    'voice-prompts': bench_voice_prompts,
+    'csm-cpu-modes': bench_csm_cpu_modes,
+    'http-pool': bench_http_pool,
+    'face-frames': bench_face_frames,
+    'face-backends': bench_face_backends,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('benchmark', nargs='?', help='benchmark to run')
+    parser.add_argument('--list', action='store_true', help='list available benchmarks')
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--batch-size', type=int, default=8, help='CSM max batch size')
+    parser.add_argument('--wait-ms', type=float, default=10.0, help='CSM max batch wait')
+    parser.add_argument('--stub', action='store_true', help='csm-batching: use the stub generator instead of CSM')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads for CSM CPU benchmarks (default: all cores)')
+    parser.add_argument('--database-url', help='database for chat benchmarks (default: temp SQLite)')
+    args = parser.parse_args(argv)
+
+    if args.list or not args.benchmark:
+        for name, func in BENCHMARKS.items():
+            print(f"{name:<20} {func.__doc__.strip().splitlines()[0]}")
+        return 0
+
+    if args.benchmark not in BENCHMARKS:
+        print(f"Unknown benchmark: {args.benchmark}")
+        return 1
+
+    BENCHMARKS[args.benchmark](args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+ChatMessage schema upgrades, retention and purging
+Brings existing databases up to the current indexes, moves inactive sessions
+out of the live table into compressed NDJSON archives, and deletes cleared
+sessions in small batches so other writers are never blocked for long
+"""
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import click
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from app import app, db
+from lazy_singleton import LazySingleton
+from models import ChatMessage, ClearedSession
+
+logger = logging.getLogger(__name__)
+
+LEGACY_SESSION_INDEX = 'ix_chat_message_session_id'
+SESSION_TIMESTAMP_INDEX = 'ix_chat_message_session_timestamp'
+
+
+# Serialises concurrent `flask upgrade-db` runs on Postgres (pg_advisory_lock key)
+SCHEMA_UPGRADE_LOCK_ID = 0x63686174
+
+
+def _existing_indexes() -> Optional[set]:
+    """Index names on the ChatMessage table, or None if the table does not exist yet"""
+    inspector = inspect(db.engine)
+    table = ChatMessage.__table__.name
+    if table not in inspector.get_table_names():
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def check_schema():
+    """
+    Warn at boot when the database predates the current indexes
+
+    Only reads the catalog; the upgrade itself runs from `flask upgrade-db`
+    so web workers never race each other on DDL or block boot on an index build.
+    """
+    try:
+        existing = _existing_indexes()
+    except Exception as e:
+        logger.warning(f"Could not inspect chat schema: {e}")
+        return
+    if existing is not None and (SESSION_TIMESTAMP_INDEX not in existing or LEGACY_SESSION_INDEX in existing):
+        logger.warning(f"Chat history index {SESSION_TIMESTAMP_INDEX} is missing or outdated; "
+                       f"run `flask upgrade-db` once to add it")
+
+
+def upgrade_schema():
+    """
+    Add indexes introduced after a database was created
+
+    db.create_all() only creates missing tables, so existing databases need the
+    composite history index added here. Run once per deploy through
+    `flask upgrade-db`; concurrent runs are safe. On Postgres the index is built
+    CONCURRENTLY so chat writes keep flowing during the build, under an advisory
+    lock so only one runner builds it; elsewhere IF NOT EXISTS makes a lost race a no-op.
+    """
+    if _existing_indexes() is None:
+        return
+    table = ChatMessage.__table__.name
+
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:lock)'), {'lock': SCHEMA_UPGRADE_LOCK_ID})
+            try:
+                # An interrupted CONCURRENTLY build leaves an invalid index that IF NOT EXISTS would keep
+                valid = connection.execute(text(
+                    'SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+                    'WHERE c.relname = :name'
+                ), {'name': SESSION_TIMESTAMP_INDEX}).scalar()
+                if valid is False:
+                    logger.info(f"Rebuilding invalid index {SESSION_TIMESTAMP_INDEX}")
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {SESSION_TIMESTAMP_INDEX}'))
+                if valid is not True:
+                    logger.info(f"Creating index {SESSION_TIMESTAMP_INDEX}...")
+                    connection.execute(text(
+                        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {SESSION_TIMESTAMP_INDEX} '
+                        f'ON {table} (session_id, timestamp, id)'
+                    ))
+                # The composite index has session_id as its leading column, making the old one redundant
+                connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {LEGACY_SESSION_INDEX}'))
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:lock)'), {'lock': SCHEMA_UPGRADE_LOCK_ID})
+        return
+
+    index = next(ix for ix in ChatMessage.__table__.indexes if ix.name == SESSION_TIMESTAMP_INDEX)
+    with db.engine.begin() as connection:
+        logger.info(f"Ensuring index {SESSION_TIMESTAMP_INDEX}")
+        connection.execute(CreateIndex(index, if_not_exists=True))
+        # The composite index has session_id as its leading column, making the old one redundant
+        connection.execute(text(f'DROP INDEX IF EXISTS {LEGACY_SESSION_INDEX}'))
+
+
+def _expired_sessions(cutoff: datetime, limit: int) -> List[str]:
+    """Sessions whose newest message is older than the cutoff"""
+    query = (select(ChatMessage.session_id)
+             .group_by(ChatMessage.session_id)
+             .having(func.max(ChatMessage.timestamp) < cutoff)
+             .limit(limit))
+    return [row.session_id for row in db.session.execute(query)]
+
+
+def archive_old_sessions(
+    max_age_days: float = None,
+    archive_dir: str = None,
+    sessions_per_batch: int = 100,
+    delete_chunk: int = 1000
+) -> dict:
+    """
+    Move sessions inactive for max_age_days into gzip NDJSON archive files
+
+    Each batch of sessions is written and fsynced to its own archive file before
+    its rows are deleted in chunks of delete_chunk, one short transaction each.
+    """
+    max_age_days = max_age_days if max_age_days is not None else \
+        float(os.environ.get('CHAT_RETENTION_DAYS', 90))
+    archive_dir = archive_dir or os.environ.get('CHAT_ARCHIVE_DIR', os.path.join('instance', 'chat_archive'))
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    totals = {'sessions': 0, 'messages': 0, 'files': []}
+    batch_number = 0
+
+    while True:
+        session_ids = _expired_sessions(cutoff, sessions_per_batch)
+        db.session.rollback()  # end the read transaction before the long write
+        if not session_ids:
+            break
+
+        batch_number += 1
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(archive_dir, f'chat-archive-{stamp}-{batch_number:04d}.ndjson.gz')
+
+        rows = (select(ChatMessage.id, ChatMessage.session_id, ChatMessage.role,
+                       ChatMessage.content, ChatMessage.timestamp)
+                .where(ChatMessage.session_id.in_(session_ids))
+                .order_by(ChatMessage.session_id, ChatMessage.timestamp, ChatMessage.id)
+                .execution_options(yield_per=1000))
+        archived_ids = []
+        with open(path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for row in db.session.execute(rows):
+                    archived_ids.append(row.id)
+                    archive.write((json.dumps({
+                        'id': row.id,
+                        'session_id': row.session_id,
+                        'role': row.role,
+                        'content': row.content,
+                        'timestamp': row.timestamp.isoformat() if row.timestamp else None
+                    }) + '\n').encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        db.session.rollback()
+
+        # Only delete what was archived; messages arriving meanwhile stay live
+        for start in range(0, len(archived_ids), delete_chunk):
+            chunk = archived_ids[start:start + delete_chunk]
+            db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(chunk)))
+            db.session.commit()
+
+        totals['sessions'] += len(session_ids)
+        totals['messages'] += len(archived_ids)
+        totals['files'].append(path)
+        logger.info(f"Archived {len(session_ids)} sessions ({len(archived_ids)} messages) to {path}")
+
+    return totals
+
+
+def mark_session_cleared(session_id: str):
+    """Tombstone a session; its rows are deleted later by the purger"""
+    db.session.merge(ClearedSession(session_id=session_id, cleared_at=datetime.utcnow()))
+    db.session.commit()
+    get_session_purger().wake()
+
+
+class SessionPurger:
+    """
+    Background thread that deletes the messages of cleared sessions
+
+    Rows go in batches of batch_size, each in its own short transaction,
+    with a pause between batches so concurrent chat writes can take the
+    database lock. The tombstone is removed once a session has no rows left.
+    """
+
+    def __init__(self, batch_size: int = None, pause_ms: float = None, poll_seconds: float = None):
+        # SQLite's busy handler retries a blocked writer with growing sleeps, so the pause
+        # must be long enough for a waiting writer to wake up inside it
+        self.batch_size = batch_size or int(os.environ.get('CHAT_PURGE_BATCH', 200))
+        self.pause_ms = pause_ms if pause_ms is not None else float(os.environ.get('CHAT_PURGE_PAUSE_MS', 20))
+        self.poll_seconds = poll_seconds or float(os.environ.get('CHAT_PURGE_POLL_SECONDS', 30))
+
+        self.rows_purged = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chat-purger', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Start purging now instead of at the next poll"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                with app.app_context():
+                    self.purge_pending()
+            except Exception as e:
+                logger.error(f"Chat purge failed: {e}")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def purge_pending(self) -> int:
+        """Purge every tombstoned session; returns the number of rows deleted"""
+        purged = 0
+        while True:
+            session_id = db.session.execute(select(ClearedSession.session_id).limit(1)).scalar()
+            if session_id is None:
+                db.session.rollback()
+                return purged
+            purged += self.purge_session(session_id)
+
+    def purge_session(self, session_id: str) -> int:
+        """Delete one session's rows batch by batch, then drop its tombstone"""
+        purged = 0
+        while True:
+            batch = (select(ChatMessage.id)
+                     .where(ChatMessage.session_id == session_id)
+                     .limit(self.batch_size)
+                     .scalar_subquery())
+            deleted = db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(batch))).rowcount
+            db.session.commit()
+            purged += deleted
+            self.rows_purged += deleted
+            if deleted < self.batch_size:
+                break
+            time.sleep(self.pause_ms / 1000)  # let waiting writers in
+
+        db.session.execute(delete(ClearedSession).where(ClearedSession.session_id == session_id))
+        db.session.commit()
+        logger.info(f"Purged {purged} messages of cleared session {session_id}")
+        return purged
+
+
+def _start_session_purger():
+    purger = SessionPurger()
+    purger.start()
+    return purger
+
+# Global purger, created and started on first use
+_session_purger = LazySingleton(_start_session_purger, 'session_purger')
+
+def get_session_purger():
+    """Get or create (and start) the global session purger"""
+    return _session_purger.get()
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Apply index upgrades to an existing database."""
+    upgrade_schema()
+    click.echo('Database schema is up to date')
+
+
+@app.cli.command('archive-chats')
+@click.option('--days', type=float, default=None, help='Archive sessions idle for this many days')
+@click.option('--archive-dir', default=None, help='Directory for .ndjson.gz archive files')
+@click.option('--batch-size', type=int, default=100, help='Sessions per archive file')
+def archive_chats_command(days, archive_dir, batch_size):
+    """Move inactive chat sessions into compressed archive files."""
+    totals = archive_old_sessions(days, archive_dir, sessions_per_batch=batch_size)
+    click.echo(f"Archived {totals['sessions']} sessions, {totals['messages']} messages "
+               f"into {len(totals['files'])} files")
@@ -0,0 +1,159 @@
+"""
+Chat turn persistence
+Writes the user and assistant messages of a turn together, either in one
+transaction per turn or grouped with other sessions' turns into one commit
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import db
+from lazy_singleton import LazySingleton
+from models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# transaction: one commit per turn, durable when write_turn returns
+# batched:     turns from all sessions are group-committed every few ms; still durable on return
+# async:       write_turn returns immediately; a crash may lose the last few milliseconds of turns
+DURABILITY_MODES = ('transaction', 'batched', 'async')
+
+
+def _build_turn(session_id, user_content, assistant_content, user_timestamp, assistant_timestamp):
+    user_msg = ChatMessage()
+    user_msg.session_id = session_id
+    user_msg.role = 'user'
+    user_msg.content = user_content
+    user_msg.timestamp = user_timestamp
+
+    assistant_msg = ChatMessage()
+    assistant_msg.session_id = session_id
+    assistant_msg.role = 'assistant'
+    assistant_msg.content = assistant_content
+    assistant_msg.timestamp = assistant_timestamp
+
+    return user_msg, assistant_msg
+
+
+class ChatTurnWriter:
+    """Persists complete chat turns according to the configured durability mode"""
+
+    def __init__(self, app, mode: str = None, interval_ms: float = None, max_batch: int = None):
+        self.app = app
+        self.mode = mode or os.environ.get('CHAT_DURABILITY', 'transaction')
+        if self.mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown chat durability mode: {self.mode}")
+        self.interval_ms = interval_ms if interval_ms is not None else \
+            float(os.environ.get('CHAT_BATCH_INTERVAL_MS', 5))
+        self.max_batch = max_batch or int(os.environ.get('CHAT_BATCH_MAX_TURNS', 256))
+
+        self._queue = queue.Queue()
+        self._worker = None
+        if self.mode != 'transaction':
+            self._worker = threading.Thread(target=self._run, name='chat-turn-writer', daemon=True)
+            self._worker.start()
+
+    def write_turn(
+        self,
+        session_id: str,
+        user_content: str,
+        assistant_content: str,
+        user_timestamp: Optional[datetime] = None
+    ) -> Tuple[dict, dict]:
+        """
+        Persist a turn and return the (user, assistant) message dicts
+
+        In async mode the dicts are returned before the rows exist, so their ids are None.
+        """
+        user_timestamp = user_timestamp or datetime.utcnow()
+        assistant_timestamp = datetime.utcnow()
+
+        if self.mode == 'transaction':
+            user_msg, assistant_msg = _build_turn(
+                session_id, user_content, assistant_content, user_timestamp, assistant_timestamp
+            )
+            try:
+                db.session.add_all([user_msg, assistant_msg])
+                db.session.flush()  # assigns ids without the post-commit refresh queries
+                result = (user_msg.to_dict(), assistant_msg.to_dict())
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return result
+
+        future = Future()
+        self._queue.put((session_id, user_content, assistant_content, user_timestamp, assistant_timestamp, future))
+
+        if self.mode == 'batched':
+            return future.result()
+
+        user_msg, assistant_msg = _build_turn(
+            session_id, user_content, assistant_content, user_timestamp, assistant_timestamp
+        )
+        return user_msg.to_dict(), assistant_msg.to_dict()
+
+    def _collect(self):
+        """Block for one turn, then take whatever else arrives within the interval"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.interval_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # flush() markers carry no turn, only a future to resolve once earlier turns are written
+            markers = [item[5] for item in batch if item[0] is None]
+            batch = [item for item in batch if item[0] is not None]
+
+            if batch:
+                try:
+                    with self.app.app_context():
+                        with Session(db.engine, expire_on_commit=False) as write_session:
+                            turns = [_build_turn(*item[:5]) for item in batch]
+                            for turn in turns:
+                                write_session.add_all(turn)
+                            write_session.commit()
+                    for item, (user_msg, assistant_msg) in zip(batch, turns):
+                        item[5].set_result((user_msg.to_dict(), assistant_msg.to_dict()))
+                except Exception as e:
+                    logger.error(f"Failed to persist {len(batch)} chat turns: {e}")
+                    for item in batch:
+                        item[5].set_exception(e)
+
+            for marker in markers:
+                marker.set_result(None)
+
+    def flush(self, timeout: float = None):
+        """Wait until every queued turn has been written (no-op in transaction mode)"""
+        if self._worker is None:
+            return
+        marker = Future()
+        self._queue.put((None, None, None, None, None, marker))
+        marker.result(timeout=timeout)
+
+def _create_turn_writer():
+    from app import app
+    return ChatTurnWriter(app)
+
+# Global turn writer, created on first use
+_turn_writer = LazySingleton(_create_turn_writer, 'turn_writer')
+
+def get_turn_writer():
+    """Get or create the global chat turn writer"""
+    return _turn_writer.get()
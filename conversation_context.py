@@ -0,0 +1,132 @@
+"""
+Rolling per-session conversation context
+Keeps the last few turns of each session in memory so the model service gets
+structured history without re-querying the full ChatMessage table every turn
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class ConversationContextStore:
+    """
+    LRU of session -> bounded deque of {'role', 'content'} messages
+
+    A session's buffer is filled from the database once, on first use; after
+    that every new message is appended by the caller as it is persisted, so the
+    cost per turn stays flat however long the conversation gets.
+
+    The store lives in each worker process. A buffer only sees messages appended
+    in its own process, so with several workers a session can miss turns another
+    worker served until its buffer is evicted; the database stays authoritative.
+    """
+
+    def __init__(self, max_messages: int = None, max_tokens: int = None, max_sessions: int = None):
+        self.max_messages = max_messages or int(os.environ.get('CHAT_CONTEXT_MESSAGES', 20))
+        self.max_tokens = max_tokens or int(os.environ.get('CHAT_CONTEXT_TOKENS', 2000))
+        self.max_sessions = max_sessions or int(os.environ.get('CHAT_CONTEXT_SESSIONS', 1000))
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, session_id: str) -> deque:
+        """Fetch the most recent messages of a session from the database"""
+        from sqlalchemy import select
+        from app import db
+        from models import ChatMessage
+
+        # Short-lived connection: the request's session must not hold one open
+        # while the model is generating
+        query = (select(ChatMessage.role, ChatMessage.content)
+                 .where(ChatMessage.session_id == session_id)
+                 .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+                 .limit(self.max_messages))
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+        buffer = deque({'role': row.role, 'content': row.content} for row in reversed(rows))
+        self._trim(buffer)
+        return buffer
+
+    def _trim(self, buffer: deque):
+        """Drop the oldest messages until the buffer fits both budgets"""
+        tokens = sum(estimate_tokens(message['content']) for message in buffer)
+        while buffer and (len(buffer) > self.max_messages or tokens > self.max_tokens):
+            tokens -= estimate_tokens(buffer.popleft()['content'])
+
+    def _store(self, session_id: str, buffer: deque) -> deque:
+        """Install a freshly loaded buffer unless another thread beat us to it (lock held)"""
+        existing = self._sessions.get(session_id)
+        if existing is not None:
+            self._sessions.move_to_end(session_id)
+            return existing
+        self._sessions[session_id] = buffer
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return buffer
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Recent messages for a session, oldest first"""
+        if not session_id:
+            return []
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is not None:
+                self._sessions.move_to_end(session_id)
+                return list(buffer)
+
+        # Query outside the lock so one slow load does not stall other sessions
+        loaded = self._load(session_id)
+        with self._lock:
+            return list(self._store(session_id, loaded))
+
+    def append(self, session_id: str, role: str, content: str, memory_only: bool = False):
+        """
+        Record a message the caller has just persisted
+
+        Sessions that are not buffered are left alone; they are loaded from the
+        database, message included, the next time they are used. memory_only
+        messages are never persisted, so they always start a buffer.
+        """
+        if not session_id:
+            return
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is None:
+                if not memory_only:
+                    return
+                buffer = self._store(session_id, deque())
+            else:
+                self._sessions.move_to_end(session_id)
+            buffer.append({'role': role, 'content': content})
+            self._trim(buffer)
+
+    def clear(self, session_id: str):
+        """Forget a session's buffer"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_messages': self.max_messages,
+                'max_tokens': self.max_tokens
+            }
+
+# Global context store, created on first use
+_context_store = LazySingleton(ConversationContextStore, 'context_store')
+
+def get_context_store():
+    """Get or create the global conversation context store"""
+    return _context_store.get()
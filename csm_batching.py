@@ -0,0 +1,180 @@
+"""
+Micro-batching scheduler for CSM speech generation
+Collects concurrent requests for a few milliseconds and runs them through the model together;
+under a backlog, requests of similar text length are batched together
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 10.0
+
+
+@dataclass
+class SpeechRequest:
+    text: str
+    speaker_id: int = 0
+    context: Optional[list] = None
+    max_duration_ms: float = 10000
+    temperature: float = 0.9
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.monotonic)
+
+    def as_kwargs(self) -> dict:
+        return {
+            'text': self.text,
+            'speaker_id': self.speaker_id,
+            'context': self.context,
+            'max_duration_ms': self.max_duration_ms,
+            'temperature': self.temperature
+        }
+
+
+class CSMBatchScheduler:
+    """Single-owner front for a CSMVoiceAgent that groups requests into batches"""
+
+    def __init__(self, agent, max_batch_size: int = None, max_wait_ms: float = None):
+        self.agent = agent
+        self.max_batch_size = max_batch_size or int(
+            os.environ.get('CSM_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE)
+        )
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(
+            os.environ.get('CSM_MAX_BATCH_WAIT_MS', DEFAULT_MAX_WAIT_MS)
+        )
+
+        self._queue = queue.Queue()
+        # Collected but not yet batched, in arrival order (only touched by the worker thread)
+        self._pending: List[SpeechRequest] = []
+        self._stats_lock = threading.Lock()
+        self.batches_run = 0
+        self.requests_served = 0
+
+        self._worker = threading.Thread(target=self._run, name='csm-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        text: str,
+        speaker_id: int = 0,
+        context: list = None,
+        max_duration_ms: float = 10000,
+        temperature: float = 0.9
+    ) -> Future:
+        """Queue a request and return a future resolving to the audio tensor (or None)"""
+        request = SpeechRequest(
+            text=text,
+            speaker_id=speaker_id,
+            context=context,
+            max_duration_ms=max_duration_ms,
+            temperature=temperature
+        )
+        self._queue.put(request)
+        return request.future
+
+    def generate_speech(self, text: str, timeout: float = None, **kwargs):
+        """Blocking drop-in for CSMVoiceAgent.generate_speech"""
+        return self.submit(text, **kwargs).result(timeout=timeout)
+
+    def _collect_batch(self) -> List[SpeechRequest]:
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        pending = self._pending
+        if not pending:
+            pending.append(self._queue.get())
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Take the rest of any backlog too, so it can be grouped by length
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return self._take_batch()
+
+    def _take_batch(self) -> List[SpeechRequest]:
+        """
+        Up to max_batch_size pending requests of similar text length, always including the oldest
+
+        Prompts are left-padded to the longest and every row runs until the longest
+        output ends, so a batch of similar lengths wastes the least work. Serving
+        the oldest request each time means no request waits behind later arrivals.
+        """
+        size = self.max_batch_size
+        if len(self._pending) <= size:
+            batch, self._pending = self._pending, []
+            return batch
+
+        oldest = self._pending[0]
+        ordered = sorted(self._pending, key=lambda req: len(req.text))
+        position = next(index for index, req in enumerate(ordered) if req is oldest)
+        # The tightest run of `size` consecutive lengths that contains the oldest request
+        start = min(range(max(0, position - size + 1), min(position, len(ordered) - size) + 1),
+                    key=lambda first: len(ordered[first + size - 1].text) - len(ordered[first].text))
+        batch = ordered[start:start + size]
+        chosen = {id(req) for req in batch}
+        self._pending = [req for req in self._pending if id(req) not in chosen]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Drop requests whose callers already gave up
+            batch = [req for req in batch if req.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.agent.generate_speech_batch([req.as_kwargs() for req in batch])
+                for req, audio in zip(batch, results):
+                    req.future.set_result(audio)
+            except Exception as e:
+                logger.error(f"CSM batch of {len(batch)} failed: {e}")
+                for req in batch:
+                    req.future.set_exception(e)
+
+            with self._stats_lock:
+                self.batches_run += 1
+                self.requests_served += len(batch)
+
+    def get_stats(self) -> dict:
+        """Get batching statistics"""
+        with self._stats_lock:
+            average = self.requests_served / self.batches_run if self.batches_run else 0.0
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'queued': self._queue.qsize() + len(self._pending),
+                'batches_run': self.batches_run,
+                'requests_served': self.requests_served,
+                'average_batch_size': round(average, 2)
+            }
+
+def _create_csm_scheduler():
+    from csm_integration import get_csm_agent
+    return CSMBatchScheduler(get_csm_agent())
+
+# Global scheduler, created on first use
+_csm_scheduler = LazySingleton(_create_csm_scheduler, 'csm_scheduler')
+
+def get_csm_scheduler():
+    """Get or create the global CSM batch scheduler"""
+    return _csm_scheduler.get()
@@ -2,14 +2,29 @@
 CSM (Conversational Speech Model) Integration for THE ISP
 Advanced speech generation using Sesame AI Labs' state-of-the-art model
 """
-import os
+import struct
+import threading
+import contextlib
 import torch
 import torchaudio
 import logging
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from huggingface_hub import hf_hub_download
 
+from csm_runtime import (
+    CSMRuntimeConfig, configure_compile, configure_threads, optimize_generator, select_device, setup_kv_caches
+)
+from lazy_singleton import LazySingleton
+
+# CSM emits one Mimi codec frame per 80ms of audio. Streaming decodes a small
+# first chunk so playback can start quickly, then larger chunks for throughput.
+FRAME_DURATION_MS = 80
+STREAM_FIRST_CHUNK_FRAMES = 2
+STREAM_CHUNK_FRAMES = 6
+# Backbone context length; prompt plus generated frames must fit in it
+MAX_SEQ_LEN = 2048
+
 @dataclass
 class Segment:
     speaker: int
@@ -19,36 +34,46 @@ class Segment:
 class CSMVoiceAgent:
     """Advanced voice agent using CSM for ultra-realistic speech generation"""
     
-    def __init__(self):
+    def __init__(self, generator=None, runtime: Optional[CSMRuntimeConfig] = None):
         self.generator = None
+        # Device, threads, CPU int8 quantization and compilation (CSM_* environment variables)
+        self.runtime = runtime or CSMRuntimeConfig.from_env()
         self.device = self._get_best_device()
         self.sample_rate = 24000
         self.initialized = False
         self.error = None
+        # The model keeps KV caches between frames, so only one generation may run at a time
+        self._generate_lock = threading.Lock()
+        # Rows the KV caches are allocated for; load_csm_1b sets them up for one
+        self._cache_batch_size = 1
         
-        # Initialize CSM if possible
-        self._init_csm()
+        if generator is not None:
+            # Pre-built generator (e.g. a stub standing in for load_csm_1b)
+            self.generator = generator
+            self.sample_rate = generator.sample_rate
+            self.initialized = True
+        else:
+            # Initialize CSM if possible
+            self._init_csm()
     
     def _get_best_device(self):
-        """Select the best available device"""
-        if torch.cuda.is_available():
-            return "cuda"
-        elif torch.backends.mps.is_available():
-            return "mps"
-        else:
-            return "cpu"
+        """Select the configured device, or the best available one"""
+        return select_device(self.runtime)
     
     def _init_csm(self):
         """Initialize the CSM model"""
         try:
             # Set environment for CSM
-            os.environ["NO_TORCH_COMPILE"] = "1"
+            configure_compile(self.runtime)
+            configure_threads(self.runtime)
             
             # Import CSM components (only if available)
             from generator import load_csm_1b
             
-            logging.info(f"Loading CSM model on {self.device}...")
+            logging.info(f"Loading CSM model on {self.device} ({self.runtime.cpu_mode}, "
+                         f"{torch.get_num_threads()} threads, compile={self.runtime.compile})...")
             self.generator = load_csm_1b(device=self.device)
+            optimize_generator(self.generator, self.runtime, self.device)
             self.sample_rate = self.generator.sample_rate
             self.initialized = True
             
@@ -92,14 +117,16 @@ class CSMVoiceAgent:
                 context = []
             
             # Generate speech with CSM
-            audio = self.generator.generate(
-                text=text,
-                speaker=speaker_id,
-                context=context,
-                max_audio_length_ms=max_duration_ms,
-                temperature=temperature,
-                topk=50
-            )
+            with self._generate_lock:
+                self._use_cache_batch(1)
+                audio = self.generator.generate(
+                    text=text,
+                    speaker=speaker_id,
+                    context=context,
+                    max_audio_length_ms=max_duration_ms,
+                    temperature=temperature,
+                    topk=50
+                )
             
             return audio
             
@@ -107,22 +134,278 @@ class CSMVoiceAgent:
             logging.error(f"CSM speech generation failed: {e}")
             return None
     
-    def create_voice_prompt(self, text: str, audio_path: str, speaker_id: int) -> Optional[Segment]:
-        """Create a voice prompt segment from text and audio file"""
+    def generate_speech_batch(self, requests: List[dict]) -> List[Optional[torch.Tensor]]:
+        """
+        Generate speech for several requests in one padded batch
+        
+        Each request is a dict of ``generate_speech`` keyword arguments; results
+        come back in the same order. Every frame step runs the model once for
+        the whole batch. Single requests, and generators without frame-level
+        access, are run one request at a time.
+        """
+        if not self.initialized:
+            logging.error("CSM not initialized")
+            return [None] * len(requests)
+        
+        if len(requests) == 1 or not hasattr(getattr(self.generator, '_model', None), 'generate_frame'):
+            return [self.generate_speech(**req) for req in requests]
+        
         try:
-            # Load and resample audio
-            audio_tensor, orig_sample_rate = torchaudio.load(audio_path)
-            audio_tensor = audio_tensor.squeeze(0)  # Remove channel dimension
-            
-            # Resample to CSM's expected sample rate
-            if orig_sample_rate != self.sample_rate:
-                audio_tensor = torchaudio.functional.resample(
-                    audio_tensor, 
-                    orig_freq=orig_sample_rate, 
-                    new_freq=self.sample_rate
+            with self._generate_lock:
+                return self._generate_batch_frames(requests)
+        except Exception as e:
+            logging.error(f"CSM batch generation failed: {e}")
+            return [None] * len(requests)
+    
+    def _use_cache_batch(self, batch_size: int):
+        """Allocate the model's KV caches for batch_size rows if they are sized differently (lock held)"""
+        model = getattr(self.generator, '_model', None)
+        if model is None or self._cache_batch_size == batch_size:
+            return
+        setup_kv_caches(model, batch_size)
+        self._cache_batch_size = batch_size
+    
+    def _generate_batch_frames(self, requests: List[dict]) -> List[Optional[torch.Tensor]]:
+        """
+        Frame-level generation loop of ``Generator.generate`` over a batch (lock held)
+        
+        Prompts are left-padded to the longest so every row shares the KV cache
+        positions; a pre-hook on the backbone masks the padding out of attention,
+        and since RoPE only sees relative offsets each row computes what it would
+        alone. Rows stop contributing at their EOS frame or frame limit, and the
+        loop ends when every row has.
+        """
+        generator = self.generator
+        model = generator._model
+        batch_size = len(requests)
+        
+        prompts = []
+        for req in requests:
+            tokens, tokens_mask = [], []
+            for segment in req.get('context') or []:
+                segment_tokens, segment_tokens_mask = generator._tokenize_segment(segment)
+                tokens.append(segment_tokens)
+                tokens_mask.append(segment_tokens_mask)
+            gen_tokens, gen_tokens_mask = generator._tokenize_text_segment(req['text'], req.get('speaker_id', 0))
+            tokens.append(gen_tokens)
+            tokens_mask.append(gen_tokens_mask)
+            prompts.append((torch.cat(tokens, dim=0).long(), torch.cat(tokens_mask, dim=0).bool()))
+        
+        limits = [int(req.get('max_duration_ms', 10000) / FRAME_DURATION_MS) for req in requests]
+        prompt_len = max(tokens.size(0) for tokens, _ in prompts)
+        max_context_len = MAX_SEQ_LEN - max(limits)
+        if prompt_len >= max_context_len:
+            raise ValueError(f"Inputs too long, must be below max_seq_len - max_generation_len: {max_context_len}")
+        
+        width = prompts[0][0].size(1)
+        curr_tokens = torch.zeros(batch_size, prompt_len, width, dtype=torch.long, device=self.device)
+        curr_tokens_mask = torch.zeros(batch_size, prompt_len, width, dtype=torch.bool, device=self.device)
+        padding = []
+        for row, (tokens, tokens_mask) in enumerate(prompts):
+            pad = prompt_len - tokens.size(0)
+            curr_tokens[row, pad:] = tokens.to(self.device)
+            curr_tokens_mask[row, pad:] = tokens_mask.to(self.device)
+            padding.append(pad)
+        curr_pos = torch.arange(0, prompt_len, device=self.device).unsqueeze(0).repeat(batch_size, 1)
+        
+        # Keys each row may attend to: everything from its first real token on
+        positions = torch.arange(0, MAX_SEQ_LEN, device=self.device)
+        key_valid = positions.unsqueeze(0) >= torch.tensor(padding, device=self.device).unsqueeze(1)
+        
+        def mask_padding(module, args, kwargs):
+            if kwargs.get('mask') is None:
+                return None
+            # Padding rows attend to themselves only, so no softmax row is empty
+            own = positions.view(1, 1, -1) == kwargs['input_pos'].unsqueeze(-1)
+            kwargs['mask'] = kwargs['mask'] & (key_valid.unsqueeze(1) | own)
+            return args, kwargs
+        
+        temperatures = [req.get('temperature', 0.9) for req in requests]
+        # sample_topk divides logits by temperature, so per-row values broadcast as a column
+        temperature = temperatures[0] if len(set(temperatures)) == 1 else \
+            torch.tensor(temperatures, device=self.device).unsqueeze(1)
+        
+        self._use_cache_batch(batch_size)
+        model.reset_caches()
+        hook = model.backbone.register_forward_pre_hook(mask_padding, with_kwargs=True)
+        
+        samples = []
+        lengths = [None] * batch_size
+        try:
+            with torch.inference_mode():
+                for step in range(max(limits)):
+                    sample = model.generate_frame(curr_tokens, curr_tokens_mask, curr_pos, temperature, 50)
+                    samples.append(sample)
+                    
+                    eos = (sample == 0).all(dim=1).tolist()
+                    for row in range(batch_size):
+                        if lengths[row] is None:
+                            if eos[row]:
+                                lengths[row] = step
+                            elif step + 1 >= limits[row]:
+                                lengths[row] = step + 1
+                    if all(length is not None for length in lengths):
+                        break
+                    
+                    zeros = torch.zeros(batch_size, 1, dtype=torch.long, device=self.device)
+                    curr_tokens = torch.cat([sample, zeros], dim=1).unsqueeze(1)
+                    curr_tokens_mask = torch.cat([torch.ones_like(sample).bool(), zeros.bool()], dim=1).unsqueeze(1)
+                    curr_pos = curr_pos[:, -1:] + 1
+                
+                audios = []
+                for row, length in enumerate(lengths):
+                    if not length:
+                        logging.error(f"CSM produced no audio for batch item {row}")
+                        audios.append(None)
+                        continue
+                    frames = torch.stack([sample[row] for sample in samples[:length]])
+                    audio = generator._audio_tokenizer.decode(frames.permute(1, 0).unsqueeze(0)).squeeze(0).squeeze(0)
+                    audios.append(self._watermark(audio))
+        finally:
+            hook.remove()
+        
+        return audios
+    
+    def _watermark(self, audio: torch.Tensor) -> torch.Tensor:
+        """Apply CSM's audio watermark the way ``Generator.generate`` does, if the generator has one"""
+        watermarker = getattr(self.generator, '_watermarker', None)
+        if watermarker is None:
+            return audio
+        from watermarking import CSM_1B_GH_WATERMARK, watermark
+        audio, wm_sample_rate = watermark(watermarker, audio, self.sample_rate, CSM_1B_GH_WATERMARK)
+        return torchaudio.functional.resample(audio, orig_freq=wm_sample_rate, new_freq=self.sample_rate)
+    
+    def generate_speech_stream(
+        self,
+        text: str,
+        speaker_id: int = 0,
+        context: List[Segment] = None,
+        max_duration_ms: float = 10000,
+        temperature: float = 0.9
+    ) -> Iterator[torch.Tensor]:
+        """
+        Generate speech incrementally, yielding audio chunks as they are decoded
+        
+        Uses the generator's own ``generate_stream`` when it has one, otherwise
+        drives CSM frame by frame and decodes every few frames. Generators that
+        expose neither are run to completion and the result is sliced, so the
+        API stays the same everywhere.
+        
+        Yields:
+            1-D audio tensors at ``self.sample_rate``
+        """
+        if not self.initialized:
+            logging.error("CSM not initialized")
+            return
+        
+        if context is None:
+            context = []
+        
+        try:
+            if hasattr(self.generator, 'generate_stream'):
+                chunks = self.generator.generate_stream(
+                    text=text,
+                    speaker=speaker_id,
+                    context=context,
+                    max_audio_length_ms=max_duration_ms,
+                    temperature=temperature,
+                    topk=50
                 )
+            elif hasattr(getattr(self.generator, '_model', None), 'generate_frame'):
+                chunks = self._stream_frames(text, speaker_id, context, max_duration_ms, temperature)
+            else:
+                chunks = self._stream_whole(text, speaker_id, context, max_duration_ms, temperature)
             
-            return Segment(text=text, speaker=speaker_id, audio=audio_tensor)
+            with self._generate_lock:
+                self._use_cache_batch(1)
+                for chunk in chunks:
+                    yield chunk
+                
+        except Exception as e:
+            logging.error(f"CSM streaming generation failed: {e}")
+    
+    def _stream_frames(self, text, speaker_id, context, max_duration_ms, temperature):
+        """Frame-level generation loop mirroring ``Generator.generate``, decoding as it goes"""
+        generator = self.generator
+        model = generator._model
+        codec = generator._audio_tokenizer
+        
+        model.reset_caches()
+        max_generation_len = int(max_duration_ms / FRAME_DURATION_MS)
+        
+        tokens, tokens_mask = [], []
+        for segment in context:
+            segment_tokens, segment_tokens_mask = generator._tokenize_segment(segment)
+            tokens.append(segment_tokens)
+            tokens_mask.append(segment_tokens_mask)
+        
+        gen_tokens, gen_tokens_mask = generator._tokenize_text_segment(text, speaker_id)
+        tokens.append(gen_tokens)
+        tokens_mask.append(gen_tokens_mask)
+        
+        prompt_tokens = torch.cat(tokens, dim=0).long().to(self.device)
+        prompt_tokens_mask = torch.cat(tokens_mask, dim=0).bool().to(self.device)
+        
+        curr_tokens = prompt_tokens.unsqueeze(0)
+        curr_tokens_mask = prompt_tokens_mask.unsqueeze(0)
+        curr_pos = torch.arange(0, prompt_tokens.size(0)).unsqueeze(0).long().to(self.device)
+        
+        max_context_len = MAX_SEQ_LEN - max_generation_len
+        if curr_tokens.size(1) >= max_context_len:
+            raise ValueError(f"Inputs too long, must be below max_seq_len - max_generation_len: {max_context_len}")
+        
+        # Mimi keeps decoder state between calls in streaming mode, so chunk
+        # boundaries do not produce clicks
+        streaming = codec.streaming(1) if hasattr(codec, 'streaming') else contextlib.nullcontext()
+        
+        pending = []
+        chunk_frames = STREAM_FIRST_CHUNK_FRAMES
+        with torch.inference_mode(), streaming:
+            for _ in range(max_generation_len):
+                sample = model.generate_frame(curr_tokens, curr_tokens_mask, curr_pos, temperature, 50)
+                if torch.all(sample == 0):
+                    break  # eos
+                
+                pending.append(sample)
+                curr_tokens = torch.cat([sample, torch.zeros(1, 1).long().to(self.device)], dim=1).unsqueeze(1)
+                curr_tokens_mask = torch.cat(
+                    [torch.ones_like(sample).bool(), torch.zeros(1, 1).bool().to(self.device)], dim=1
+                ).unsqueeze(1)
+                curr_pos = curr_pos[:, -1:] + 1
+                
+                if len(pending) >= chunk_frames:
+                    yield codec.decode(torch.stack(pending).permute(1, 2, 0)).squeeze(0).squeeze(0)
+                    pending = []
+                    chunk_frames = STREAM_CHUNK_FRAMES
+            
+            if pending:
+                yield codec.decode(torch.stack(pending).permute(1, 2, 0)).squeeze(0).squeeze(0)
+    
+    def _stream_whole(self, text, speaker_id, context, max_duration_ms, temperature):
+        """Fallback for generators without frame access: generate fully, then slice"""
+        audio = self.generator.generate(
+            text=text,
+            speaker=speaker_id,
+            context=context,
+            max_audio_length_ms=max_duration_ms,
+            temperature=temperature,
+            topk=50
+        )
+        chunk_samples = int(self.sample_rate * FRAME_DURATION_MS / 1000) * STREAM_CHUNK_FRAMES
+        for start in range(0, len(audio), chunk_samples):
+            yield audio[start:start + chunk_samples]
+    
+    def create_voice_prompt(self, text: str, audio_path: str, speaker_id: int) -> Optional[Segment]:
+        """
+        Create a voice prompt segment from text and audio file
+        
+        Clips are loaded and resampled to CSM's sample rate once, then served
+        from the voice prompt registry until the file changes.
+        """
+        try:
+            from voice_prompts import get_voice_prompt_registry
+            
+            return get_voice_prompt_registry().get_segment(text, speaker_id, audio_path, self.sample_rate)
             
         except Exception as e:
             logging.error(f"Failed to create voice prompt: {e}")
@@ -153,18 +436,37 @@ class CSMVoiceAgent:
             'device': self.device,
             'sample_rate': self.sample_rate,
             'error': self.error,
-            'model_available': self.generator is not None
+            'model_available': self.generator is not None,
+            'runtime': self.runtime.to_dict(),
+            'threads': torch.get_num_threads()
         }
 
-# Global CSM instance
-csm_agent = None
+def pcm16_bytes(audio: torch.Tensor) -> bytes:
+    """Convert a float audio tensor in [-1, 1] to little-endian 16-bit PCM"""
+    samples = (audio.detach().cpu().clamp(-1.0, 1.0) * 32767).to(torch.int16)
+    return samples.numpy().tobytes()
+
+def streaming_wav_header(sample_rate: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """
+    WAV header for a stream of unknown length
+    
+    The RIFF and data sizes are set to 0xFFFFFFFF, which browsers and ffmpeg
+    treat as "read until EOF".
+    """
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+        + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b'data' + struct.pack('<I', 0xFFFFFFFF)
+    )
+
+# Global CSM instance, created on first use
+_csm_agent = LazySingleton(CSMVoiceAgent, 'csm_agent')
 
 def get_csm_agent():
     """Get or create the global CSM agent instance"""
-    global csm_agent
-    if csm_agent is None:
-        csm_agent = CSMVoiceAgent()
-    return csm_agent
+    return _csm_agent.get()
 
 def test_csm_integration():
     """Test CSM integration with a simple example"""
@@ -0,0 +1,116 @@
+"""
+CSM inference runtime configuration
+Device selection, torch thread counts, CPU dynamic int8 quantization and
+optional torch.compile, all chosen through environment variables
+"""
+import os
+import logging
+from dataclasses import dataclass, asdict
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# bf16: weights as load_csm_1b leaves them; fp32: upcast to float32;
+# int8: float32 plus dynamic int8 quantization of every nn.Linear (fp32 and int8 are CPU only)
+CPU_MODES = ('bf16', 'fp32', 'int8')
+
+
+def _flag(name: str, default: str = '0') -> bool:
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+def _default_threads() -> int:
+    """Split the machine's cores evenly between the server's worker processes"""
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+@dataclass
+class CSMRuntimeConfig:
+    device: str = 'auto'
+    cpu_mode: str = 'bf16'
+    threads: int = 0            # intra-op threads; 0 leaves torch's default
+    interop_threads: int = 0    # inter-op threads; 0 leaves torch's default
+    compile: bool = False
+
+    def __post_init__(self):
+        if self.cpu_mode not in CPU_MODES:
+            raise ValueError(f"Unknown CSM CPU mode: {self.cpu_mode}")
+
+    @classmethod
+    def from_env(cls) -> 'CSMRuntimeConfig':
+        return cls(
+            device=os.environ.get('CSM_DEVICE', 'auto'),
+            cpu_mode=os.environ.get('CSM_CPU_MODE', 'bf16'),
+            threads=int(os.environ.get('CSM_THREADS', _default_threads())),
+            interop_threads=int(os.environ.get('CSM_INTEROP_THREADS', 0)),
+            compile=_flag('CSM_COMPILE')
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def select_device(config: CSMRuntimeConfig) -> str:
+    """The configured device, or the best available one for 'auto'"""
+    if config.device != 'auto':
+        return config.device
+    if torch.cuda.is_available():
+        return "cuda"
+    elif torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def configure_threads(config: CSMRuntimeConfig):
+    """Apply thread counts; must run before the first parallel torch op in the process"""
+    if config.threads:
+        torch.set_num_threads(config.threads)
+    if config.interop_threads:
+        try:
+            torch.set_num_interop_threads(config.interop_threads)
+        except RuntimeError as e:
+            # Only settable once, before any inter-op parallel work has started
+            logger.warning(f"Could not set inter-op threads: {e}")
+
+
+def configure_compile(config: CSMRuntimeConfig):
+    """The Mimi codec compiles itself unless NO_TORCH_COMPILE is set; call before loading"""
+    if config.compile:
+        os.environ.pop("NO_TORCH_COMPILE", None)
+    else:
+        os.environ["NO_TORCH_COMPILE"] = "1"
+
+
+def setup_kv_caches(model, batch_size: int):
+    """(Re)allocate a CSM model's KV caches for batch_size rows in the model's current dtype"""
+    # torchtune skips setup on layers that already have a cache, so drop the old ones first
+    for module in model.modules():
+        if getattr(module, 'kv_cache', None) is not None:
+            module.kv_cache = None
+    model.setup_caches(batch_size)
+
+
+def optimize_generator(generator, config: CSMRuntimeConfig, device: str):
+    """Convert, quantize and/or compile a loaded CSM generator's model in place"""
+    model = generator._model
+
+    if config.cpu_mode != 'bf16':
+        if device != 'cpu':
+            logger.warning(f"CSM {config.cpu_mode} mode only applies on CPU, ignoring it on {device}")
+        else:
+            # load_csm_1b casts to bfloat16 and sizes the KV caches for it; dynamic int8
+            # Linear kernels only take float32 activations, so int8 starts from fp32 too
+            model.float()
+            setup_kv_caches(model, 1)
+            logger.info("CSM model converted to float32")
+            if config.cpu_mode == 'int8':
+                # Weights become int8; activations are quantized on the fly per batch
+                torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+                logger.info("CSM linear layers quantized to dynamic int8")
+
+    if config.compile:
+        # generate_frame is what the generator calls once per 80ms frame
+        model.generate_frame = torch.compile(model.generate_frame, dynamic=True)
+        logger.info("CSM frame generation compiled with torch.compile")
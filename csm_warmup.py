@@ -0,0 +1,96 @@
+"""
+CSM background warm-up and readiness
+Loads the CSM model in a background thread at boot and runs one short dummy
+generation, so no user request pays for the weight load or first-call
+allocation. Until then speech routes answer 503 with a Retry-After hint.
+"""
+import os
+import time
+import logging
+import threading
+
+from service_registry import services
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+# idle: warm-up never started, the agent loads lazily on first use as before
+WARMUP_STATES = ('idle', 'loading', 'warming', 'ready', 'failed')
+
+
+class CSMWarmup:
+    """Tracks the CSM model through loading -> warming -> ready (or failed)"""
+
+    def __init__(self, warmup_text: str = None, warmup_ms: float = None, retry_after: int = None):
+        self.warmup_text = warmup_text or os.environ.get('CSM_WARMUP_TEXT', 'Hello.')
+        self.warmup_ms = warmup_ms or float(os.environ.get('CSM_WARMUP_MS', 1000))
+        self.retry_after = retry_after or int(os.environ.get('CSM_WARMUP_RETRY_AFTER', 10))
+
+        self.state = 'idle'
+        self.error = None
+        self.started_at = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> threading.Thread:
+        """Start warming in the background (once)"""
+        with self._lock:
+            if self._thread is None:
+                self.state = 'loading'
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name='csm-warmup', daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            agent = services.get('csm')
+            self.load_seconds = time.perf_counter() - start
+            if not agent.is_available():
+                raise RuntimeError(agent.error or 'CSM not available')
+
+            self.state = 'warming'
+            start = time.perf_counter()
+            if agent.generate_speech(self.warmup_text, max_duration_ms=self.warmup_ms) is None:
+                raise RuntimeError('Warm-up generation failed')
+            self.warmup_seconds = time.perf_counter() - start
+
+            self.state = 'ready'
+            logger.info(f"CSM ready: loaded in {self.load_seconds:.1f}s, warmed in {self.warmup_seconds:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f"CSM warm-up failed: {e}")
+
+    def is_pending(self) -> bool:
+        """True while the model is loading or warming; callers should not block on it"""
+        return self.state in ('loading', 'warming')
+
+    def is_ready(self) -> bool:
+        return self.state == 'ready'
+
+    def get_status(self) -> dict:
+        return {
+            'state': self.state,
+            'ready': self.is_ready(),
+            'error': self.error,
+            'elapsed_seconds': round(time.time() - self.started_at, 1) if self.started_at else None,
+            'load_seconds': round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            'warmup_seconds': round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None
+        }
+
+# Global warm-up tracker, created on first use
+_csm_warmup = LazySingleton(CSMWarmup, 'csm_warmup')
+
+def get_csm_warmup():
+    """Get or create the global CSM warm-up tracker"""
+    return _csm_warmup.get()
+
+
+def start_from_env():
+    """Start the CSM warm-up at boot unless CSM_WARMUP is disabled"""
+    if os.environ.get('CSM_WARMUP', '1').lower() not in ('0', 'false', 'no'):
+        get_csm_warmup().start()
@@ -1,44 +1,115 @@
 """
 Face Swap Service for Avatar Animation
-Uses HuggingFace models for real-time face swapping and animation
+Renders speaking faces through a pluggable backend: HuggingFace models, or a
+local CPU mouth warp (FACE_SWAP_BACKEND=local)
 """
 
 import os
+import re
 import logging
-import requests
-import json
 import base64
+import hashlib
 import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Optional
 from PIL import Image
 import numpy as np
 
+from face_backends import PHONEME_EXPRESSIONS, FaceBackend, SourceFace, create_face_backend
+from lazy_singleton import LazySingleton
+from viseme_atlas import EMOTIONS, get_viseme_atlas
+
 logger = logging.getLogger(__name__)
 
+# Longest side, in pixels, the source face is downscaled to once at load time
+FACE_SWAP_INPUT_SIZE = int(os.environ.get('FACE_SWAP_INPUT_SIZE', 512))
+
+
+AVATAR_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Keys a timeline entry may set; anything else is rejected rather than ignored
+TIMELINE_KEYS = ('phoneme', 'emotion', 'intensity')
+
+
+def timeline_error(timeline) -> Optional[str]:
+    """Why a timeline cannot be rendered, or None if every entry is well-formed"""
+    if not isinstance(timeline, list) or not timeline:
+        return 'timeline must be a non-empty list'
+    for index, entry in enumerate(timeline):
+        if isinstance(entry, str):
+            continue
+        if not isinstance(entry, dict):
+            return f'timeline[{index}] must be a phoneme string or an object'
+        unknown = sorted(set(entry) - set(TIMELINE_KEYS))
+        if unknown:
+            return f'timeline[{index}] has unknown keys: {", ".join(unknown)}'
+        for key in ('phoneme', 'emotion'):
+            if key in entry and not isinstance(entry[key], str):
+                return f'timeline[{index}].{key} must be a string'
+        intensity = entry.get('intensity')
+        if intensity is not None and (isinstance(intensity, bool) or not isinstance(intensity, (int, float))
+                                      or not 0.0 <= intensity <= 1.0):
+            return f'timeline[{index}].intensity must be a number from 0 to 1'
+    return None
+
+
+def image_mimetype(data: bytes) -> str:
+    """Content type of encoded image bytes, from their magic number"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
 class FaceSwapService:
-    def __init__(self):
-        # Use the latest face swap models from HuggingFace
-        self.face_swap_api = "https://api-inference.huggingface.co/models/deepinsight/inswapper"
-        self.face_enhance_api = "https://api-inference.huggingface.co/models/sczhou/CodeFormer"
-        self.face_animate_api = "https://api-inference.huggingface.co/models/runwayml/stable-video-diffusion-img2vid"
-        
-        self.headers = None
+    def __init__(self, backend: FaceBackend = None, http_client=None, atlas=None):
+        # Where frames come from; http_client only applies to the huggingface backend
+        if backend is None:
+            name = os.environ.get('FACE_SWAP_BACKEND', 'huggingface')
+            backend = create_face_backend(name, http_client=http_client) if name == 'huggingface' \
+                else create_face_backend(name)
+        self.backend = backend
+        # Pre-rendered phoneme faces per avatar, built when the source face is set
+        self.atlas = atlas or get_viseme_atlas()
         self.is_initialized = False
-        self.source_face = None  # User's uploaded avatar
+        # Default avatar for requests that name none, downscaled once: RGB pixels, JPEG bytes and their base64
+        self.source = None
+        # Recently loaded avatars by hash (avatar_id), so per-request avatars are decoded once
+        self.max_sources = int(os.environ.get('FACE_SWAP_MAX_AVATARS', 8))
+        # Prepared avatars on disk, so an avatar_id issued by one worker resolves in every worker
+        self.avatar_dir = os.environ.get('FACE_SWAP_AVATAR_DIR', os.path.join('.cache', 'avatars'))
+        self.max_avatar_files = int(os.environ.get('FACE_SWAP_MAX_AVATAR_FILES', 256))
+        self._sources = OrderedDict()
+        self._sources_lock = threading.Lock()
+        # Bounds how many remote frame renders run at once across all timelines
+        self.render_workers = int(os.environ.get('FACE_SWAP_RENDER_WORKERS', 8))
+        self._render_pool = ThreadPoolExecutor(max_workers=self.render_workers, thread_name_prefix='face-render')
         
+    @property
+    def source_face(self):
+        """JPEG bytes of the avatar, or None"""
+        return self.source.jpeg if self.source else None
+    
+    @property
+    def source_image(self):
+        """RGB pixels of the avatar, or None"""
+        return self.source.image if self.source else None
+    
+    @property
+    def source_face_hash(self):
+        return self.source.hash if self.source else None
+    
     def initialize(self):
-        """Initialize the face swap service with HuggingFace API"""
+        """Initialize the face swap service and its backend"""
         try:
-            logger.info("Initializing Face Swap service...")
-            
-            # Get HuggingFace token
-            hf_token = os.environ.get('HUGGINGFACE_TOKEN')
-            if not hf_token:
-                raise ValueError("HUGGINGFACE_TOKEN environment variable not set")
+            logger.info(f"Initializing Face Swap service ({self.backend.name} backend)...")
             
-            self.headers = {
-                "Authorization": f"Bearer {hf_token}",
-                "Content-Type": "application/json"
-            }
+            self.backend.initialize()
             
             self.is_initialized = True
             logger.info("Face Swap service initialized successfully")
@@ -48,152 +119,280 @@ class FaceSwapService:
             self.is_initialized = False
             raise
     
+    def load_source_face(self, image_data):
+        """
+        Prepare an avatar image for rendering and start building its atlas
+        
+        The image is downscaled once to the model's input size. Prepared
+        avatars are kept by hash (their avatar_id) in memory and in
+        avatar_dir, so sending the same image again is a lookup and any worker
+        can find it with get_source_face. Raises OSError (PIL) if the data is
+        not a readable image.
+        
+        Returns:
+            SourceFace: The prepared avatar
+        """
+        # Frames depend on the input size and the backend, so both are part of the atlas key
+        face_hash = hashlib.sha256(
+            image_data + f"{FACE_SWAP_INPUT_SIZE}:{self.backend.name}".encode()
+        ).hexdigest()
+        source = self._cached_source(face_hash)
+        if source is not None:
+            return source
+        
+        image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        image.thumbnail((FACE_SWAP_INPUT_SIZE, FACE_SWAP_INPUT_SIZE), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=92)
+        
+        source = self._remember(image, buffer.getvalue(), face_hash)
+        self._save_avatar(source)
+        logger.info(f"Source face {face_hash[:12]} loaded ({image.width}x{image.height}, {len(source.jpeg)} bytes)")
+        return source
+    
+    def get_source_face(self, avatar_id):
+        """
+        An avatar prepared earlier by load_source_face, in this or another worker
+        
+        Returns:
+            SourceFace: The avatar, or None if the id is unknown or has expired
+        """
+        if not isinstance(avatar_id, str) or not AVATAR_ID_PATTERN.match(avatar_id):
+            return None
+        source = self._cached_source(avatar_id)
+        if source is not None:
+            return source
+        
+        path = os.path.join(self.avatar_dir, f"{avatar_id}.jpg")
+        try:
+            with open(path, 'rb') as f:
+                jpeg = f.read()
+            os.utime(path)
+            image = Image.open(io.BytesIO(jpeg)).convert('RGB')
+        except OSError:
+            return None
+        return self._remember(image, jpeg, avatar_id)
+    
+    def _cached_source(self, face_hash):
+        with self._sources_lock:
+            source = self._sources.get(face_hash)
+            if source is not None:
+                self._sources.move_to_end(face_hash)
+            return source
+    
+    def _remember(self, image, jpeg, face_hash):
+        """Keep a prepared avatar in memory and start building its atlas"""
+        source = SourceFace(
+            image=np.asarray(image),
+            jpeg=jpeg,
+            b64=base64.b64encode(jpeg).decode('ascii'),
+            hash=face_hash
+        )
+        with self._sources_lock:
+            self._sources[face_hash] = source
+            while len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        
+        # Render (or load) every phoneme face for this avatar in the background
+        if self.is_initialized:
+            self.atlas.build(face_hash, partial(self._render_phoneme_face, source=source))
+        return source
+    
+    def _save_avatar(self, source):
+        """Write a prepared avatar to avatar_dir, keeping only the most recently used max_avatar_files"""
+        try:
+            os.makedirs(self.avatar_dir, exist_ok=True)
+            path = os.path.join(self.avatar_dir, f"{source.hash}.jpg")
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(source.jpeg)
+            os.replace(temp_path, path)
+            
+            files = [entry for entry in os.scandir(self.avatar_dir) if entry.name.endswith('.jpg')]
+            files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+            for entry in files[self.max_avatar_files:]:
+                os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not store avatar {source.hash[:12]}: {e}")
+    
     def set_source_face(self, image_path):
-        """Set the source face image (user's avatar)"""
+        """Set the default avatar, used when a request names none (server configuration, not per client)"""
         try:
             with open(image_path, 'rb') as f:
-                image_data = f.read()
-                self.source_face = base64.b64encode(image_data).decode('utf-8')
-            logger.info(f"Source face loaded from {image_path}")
+                self.source = self.load_source_face(f.read())
             return True
-        except Exception as e:
-            logger.error(f"Failed to load source face: {e}")
+        except OSError as e:
+            logger.error(f"Failed to load source face {image_path}: {e}")
             return False
     
-    def generate_speaking_face(self, emotion="neutral", intensity=0.5):
+    def generate_speaking_face(self, emotion="neutral", intensity=0.5, phoneme=None, source=None):
         """
         Generate an animated face with speaking expression
         
         Args:
             emotion (str): Emotion type (neutral, happy, surprised, etc.)
             intensity (float): Animation intensity (0.0 to 1.0)
+            phoneme (str): Mouth shape to render, if any
+            source (SourceFace): Avatar to animate; defaults to the service's source face
             
         Returns:
-            str: Base64 encoded image data
+            bytes: Encoded image data
         """
-        if not self.is_initialized or not self.source_face:
+        source = source or self.source
+        if not self.is_initialized or not source:
             raise RuntimeError("Face swap service not initialized or no source face")
         
         try:
-            # Create different mouth shapes for speaking animation
-            mouth_shapes = {
-                'closed': 0.0,
-                'slightly_open': 0.2,
-                'open': 0.5,
-                'wide_open': 0.8,
-                'o_shape': 0.3,
-                'smile': 0.4
-            }
-            
-            # Generate speaking expression based on phoneme
-            expression_prompt = self._get_expression_prompt(emotion, intensity)
-            
-            payload = {
-                "inputs": {
-                    "source_image": self.source_face,
-                    "expression": expression_prompt,
-                    "intensity": intensity
-                },
-                "parameters": {
-                    "num_inference_steps": 20,
-                    "guidance_scale": 7.5,
-                    "output_format": "jpeg"
-                }
-            }
-            
-            response = requests.post(
-                self.face_swap_api,
-                headers=self.headers,
-                json=payload,
-                timeout=15
-            )
-            
-            if response.status_code == 200:
-                # Return the generated face image
-                if response.headers.get('content-type', '').startswith('image/'):
-                    image_data = base64.b64encode(response.content).decode('utf-8')
-                    return image_data
-                else:
-                    # Handle JSON response
-                    result = response.json()
-                    if 'image' in result:
-                        return result['image']
-                    
-            logger.warning(f"Face swap API returned status {response.status_code}")
-            return None
-            
+            return self.backend.render(source, phoneme, emotion, intensity)
         except Exception as e:
             logger.error(f"Face swap generation error: {e}")
             return None
     
-    def _get_expression_prompt(self, emotion, intensity):
-        """Generate expression prompt for different emotions and speaking states"""
-        base_prompts = {
-            'neutral': "natural speaking expression, slight mouth movement",
-            'happy': "smiling while speaking, warm expression",
-            'surprised': "surprised expression with open mouth",
-            'focused': "concentrated expression, slight frown",
-            'friendly': "warm, welcoming expression while talking"
-        }
-        
-        intensity_modifiers = {
-            0.0: "very subtle",
-            0.3: "gentle",
-            0.5: "moderate",
-            0.7: "pronounced",
-            1.0: "very expressive"
-        }
-        
-        base = base_prompts.get(emotion, base_prompts['neutral'])
-        modifier = intensity_modifiers.get(round(intensity, 1), "moderate")
-        
-        return f"{modifier} {base}, high quality, realistic"
+    def _render_phoneme_face(self, phoneme, emotion, intensity, source=None):
+        """Backend rendering of one phoneme face (atlas builder and cache-miss fallback)"""
+        return self.generate_speaking_face(emotion, intensity, phoneme=phoneme, source=source)
     
-    def create_phoneme_face(self, phoneme, base_emotion="neutral"):
+    def create_phoneme_face(self, phoneme, base_emotion="neutral", intensity=None):
         """
         Create a face expression for a specific phoneme
         
+        Served from the avatar's viseme atlas when the frame has been rendered,
+        otherwise rendered by the backend.
+        
         Args:
             phoneme (str): Phoneme type (a, e, i, o, u, m, b, p, f, s)
             base_emotion (str): Base emotional state
+            intensity (float): Mouth intensity; defaults to the phoneme's own
             
         Returns:
-            str: Base64 encoded image data
+            bytes: Encoded image data
         """
-        phoneme_expressions = {
-            'a': ("open mouth, ah sound", 0.7),
-            'e': ("slightly open mouth, eh sound", 0.4),
-            'i': ("narrow mouth opening, ee sound", 0.3),
-            'o': ("rounded mouth, oh sound", 0.5),
-            'u': ("pursed lips, oo sound", 0.4),
-            'm': ("closed lips, humming", 0.1),
-            'b': ("lips together, b sound", 0.2),
-            'p': ("puffed cheeks, p sound", 0.3),
-            'f': ("lip bite, f sound", 0.2),
-            's': ("slight smile, s sound", 0.3)
-        }
+        if phoneme not in PHONEME_EXPRESSIONS:
+            phoneme = 'rest'
+        if intensity is None:
+            intensity = PHONEME_EXPRESSIONS[phoneme][1] if phoneme in PHONEME_EXPRESSIONS else 0.3
+        
+        if self.source_face_hash and base_emotion in EMOTIONS:
+            frame = self.atlas.get(self.source_face_hash, phoneme, base_emotion, intensity)
+            if frame is not None:
+                return frame
+        
+        return self._render_phoneme_face(phoneme, base_emotion, intensity)
+    
+    def _timeline_frame(self, entry, default_emotion):
+        """Normalized (phoneme, emotion, intensity) for one timeline entry (checked by timeline_error)"""
+        if isinstance(entry, str):
+            entry = {'phoneme': entry}
+        phoneme = entry.get('phoneme', 'rest')
+        if phoneme not in PHONEME_EXPRESSIONS:
+            phoneme = 'rest'
+        emotion = entry.get('emotion', default_emotion)
+        intensity = entry.get('intensity')
+        if intensity is None:
+            intensity = PHONEME_EXPRESSIONS[phoneme][1] if phoneme in PHONEME_EXPRESSIONS else 0.3
+        return phoneme, emotion, round(float(intensity), 2)
+    
+    def iter_timeline(self, timeline, emotion="neutral", ordered=True, source=None):
+        """
+        Render a phoneme timeline, yielding (index, frame) pairs
+        
+        Identical (phoneme, emotion, intensity) frames are rendered once; atlas
+        hits are answered immediately and the rest go to the shared render
+        pool concurrently. With ordered=True frames are yielded in timeline
+        order as soon as every earlier one is ready, otherwise as they complete.
+        
+        Args:
+            timeline (list): Phoneme strings or {'phoneme', 'emotion', 'intensity'} dicts
+            emotion (str): Emotion for entries that do not set one
+            ordered (bool): Yield in timeline order rather than completion order
+            source (SourceFace): Avatar to animate; defaults to the service's source face
+        """
+        source = source or self.source
+        if not self.is_initialized or not source:
+            raise RuntimeError("Face swap service not initialized or no source face")
+        
+        keys = [self._timeline_frame(entry, emotion) for entry in timeline]
+        positions = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+        
+        frames = [None] * len(keys)
+        ready = [False] * len(keys)
+        futures = {}
+        for key, indexes in positions.items():
+            phoneme, frame_emotion, intensity = key
+            frame = None
+            if frame_emotion in EMOTIONS:
+                frame = self.atlas.get(source.hash, phoneme, frame_emotion, intensity)
+            if frame is not None:
+                for index in indexes:
+                    frames[index], ready[index] = frame, True
+            else:
+                futures[self._render_pool.submit(self._render_phoneme_face, *key, source=source)] = indexes
         
-        if phoneme in phoneme_expressions:
-            expression, intensity = phoneme_expressions[phoneme]
-            return self.generate_speaking_face(f"{base_emotion}_{expression}", intensity)
+        next_index = 0
         
-        return self.generate_speaking_face(base_emotion, 0.3)
+        def release(index):
+            # Only the caller holds a frame once it has been yielded
+            frame, frames[index] = frames[index], None
+            return frame
+        
+        def drain():
+            # Yield the ready prefix (ordered) or everything newly ready (unordered)
+            nonlocal next_index
+            while next_index < len(keys) and ready[next_index]:
+                yield next_index, release(next_index)
+                next_index += 1
+        
+        if ordered:
+            yield from drain()
+        else:
+            for index in range(len(keys)):
+                if ready[index]:
+                    yield index, release(index)
+        
+        for future in as_completed(futures):
+            frame = future.result()
+            for index in futures.pop(future):
+                frames[index], ready[index] = frame, True
+                if not ordered:
+                    yield index, release(index)
+            del frame
+            if ordered:
+                yield from drain()
+    
+    def render_timeline(self, timeline, emotion="neutral", source=None):
+        """
+        Render a phoneme timeline concurrently
+        
+        Returns:
+            list: Encoded image bytes (None where generation failed), in timeline order
+        """
+        frames = [None] * len(timeline)
+        for index, frame in self.iter_timeline(timeline, emotion, source=source):
+            frames[index] = frame
+        return frames
     
     def get_status(self):
         """Get the current status of the face swap service"""
         return {
             'initialized': self.is_initialized,
             'has_source_face': self.source_face is not None,
-            'models': ['deepinsight/inswapper', 'sczhou/CodeFormer'],
+            'atlas': self.atlas.get_stats(),
+            'atlas_complete': self.atlas.is_complete(self.source_face_hash) if self.source_face_hash else False,
             'available': self.is_initialized,
-            'method': 'HuggingFace Face Swap API'
+            **self.backend.get_status()
         }
 
-# Global service instance
-face_swap_service = FaceSwapService()
+def _create_face_swap_service():
+    service = FaceSwapService()
+    service.initialize()
+    return service
+
+# Global service instance, created and initialized on first use
+# (a failed initialize stores nothing, so the next call retries)
+_face_swap_service = LazySingleton(_create_face_swap_service, 'face_swap_service')
 
 def get_face_swap_service():
     """Get the global face swap service instance"""
-    if not face_swap_service.is_initialized:
-        face_swap_service.initialize()
-    return face_swap_service
\ No newline at end of file
+    return _face_swap_service.get()
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Bounded worker pool for FFmpeg jobs
+Runs crop/mux commands concurrently with per-job timeouts, cancellation,
+queue backpressure and streamed (not buffered) stderr progress
+"""
+import os
+import uuid
+import queue
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future, CancelledError
+from typing import Callable, List, Optional
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when the job queue is full"""
+
+
+class FFmpegJobError(RuntimeError):
+    """Raised when an FFmpeg job fails, times out or is cancelled"""
+
+
+class FFmpegJob:
+    """A single queued FFmpeg invocation"""
+
+    def __init__(self, cmd: List[str], timeout: float, on_progress: Optional[Callable] = None):
+        self.id = uuid.uuid4().hex
+        self.cmd = cmd
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.state = 'queued'
+        self.progress = {}
+        self.returncode = None
+        self.stderr_tail = deque(maxlen=50)
+        self.future = Future()
+        self._process = None
+        self._cancelled = threading.Event()
+        self._timed_out = False
+
+    def cancel(self) -> bool:
+        """Cancel the job; a running FFmpeg process is killed"""
+        self._cancelled.set()
+        if self.future.cancel():
+            self.state = 'cancelled'
+            return True
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+            return True
+        return False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def result(self, timeout: float = None) -> 'FFmpegJob':
+        """Wait for the job and raise FFmpegJobError if it did not succeed"""
+        try:
+            return self.future.result(timeout=timeout)
+        except CancelledError:
+            raise FFmpegJobError(f"FFmpeg job {self.id} cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'state': self.state,
+            'progress': self.progress,
+            'returncode': self.returncode
+        }
+
+
+class FFmpegWorkerPool:
+    """Fixed set of worker threads, each supervising one FFmpeg process at a time"""
+
+    def __init__(self, workers: int = None, queue_size: int = None, default_timeout: float = None):
+        self.workers = workers or int(os.environ.get('FFMPEG_WORKERS', os.cpu_count() or 2))
+        self.queue_size = queue_size or int(os.environ.get('FFMPEG_QUEUE_SIZE', self.workers * 4))
+        self.default_timeout = default_timeout or float(os.environ.get('FFMPEG_JOB_TIMEOUT', 120))
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'ffmpeg-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(
+        self,
+        cmd: List[str],
+        timeout: float = None,
+        on_progress: Optional[Callable] = None,
+        block: bool = False
+    ) -> FFmpegJob:
+        """
+        Queue an FFmpeg command
+
+        Args:
+            cmd: Full ffmpeg argv (starting with "ffmpeg")
+            timeout: Seconds before the process is killed
+            on_progress: Called with the progress dict as FFmpeg reports it
+            block: Wait for queue space instead of raising PoolBusyError
+        """
+        job = FFmpegJob(cmd, timeout or self.default_timeout, on_progress)
+        try:
+            self._queue.put(job, block=block)
+        except queue.Full:
+            raise PoolBusyError(f"FFmpeg queue full ({self.queue_size} jobs waiting)")
+        return job
+
+    def run(self, cmd: List[str], timeout: float = None, on_progress: Optional[Callable] = None) -> FFmpegJob:
+        """Submit a command, wait for it and return the finished job"""
+        job = self.submit(cmd, timeout=timeout, on_progress=on_progress, block=True)
+        return job.result()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job: FFmpegJob):
+        # -progress writes machine-readable key=value lines to stdout; stderr is
+        # drained line by line so long encodes never accumulate output in memory
+        cmd = [job.cmd[0], '-hide_banner', '-nostats', '-progress', 'pipe:1'] + job.cmd[1:]
+        job.state = 'running'
+
+        try:
+            job._process = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL, text=True, bufsize=1
+            )
+        except OSError as e:
+            job.state = 'failed'
+            job.future.set_exception(FFmpegJobError(f"Failed to start ffmpeg: {e}"))
+            return
+
+        process = job._process
+        if job.cancelled:
+            process.kill()
+
+        def on_timeout():
+            job._timed_out = True
+            process.kill()
+
+        watchdog = threading.Timer(job.timeout, on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+
+        stderr_reader = threading.Thread(target=self._drain_stderr, args=(job, process), daemon=True)
+        stderr_reader.start()
+
+        try:
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                if not key:
+                    continue
+                job.progress[key] = value
+                if key == 'progress' and job.on_progress is not None:
+                    try:
+                        job.on_progress(dict(job.progress))
+                    except Exception as e:
+                        logger.warning(f"FFmpeg progress callback failed: {e}")
+            job.returncode = process.wait()
+        finally:
+            watchdog.cancel()
+            stderr_reader.join()
+
+        if job.returncode == 0:
+            job.state = 'done'
+            job.future.set_result(job)
+        elif job.cancelled:
+            job.state = 'cancelled'
+            job.future.set_exception(FFmpegJobError(f"FFmpeg job {job.id} cancelled"))
+        elif job._timed_out:
+            job.state = 'timeout'
+            job.future.set_exception(FFmpegJobError(f"FFmpeg job {job.id} timed out after {job.timeout}s"))
+        else:
+            job.state = 'failed'
+            tail = '\n'.join(job.stderr_tail)
+            job.future.set_exception(FFmpegJobError(f"ffmpeg exited with {job.returncode}: {tail}"))
+
+    def _drain_stderr(self, job: FFmpegJob, process):
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                job.stderr_tail.append(line)
+                logger.debug(f"ffmpeg[{job.id[:8]}] {line}")
+
+    def get_stats(self) -> dict:
+        """Get pool sizing and queue depth"""
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queued': self._queue.qsize()
+        }
+
+# Global pool instance, created on first use
+_ffmpeg_pool = LazySingleton(FFmpegWorkerPool, 'ffmpeg_pool')
+
+def get_ffmpeg_pool():
+    """Get or create the global FFmpeg worker pool"""
+    return _ffmpeg_pool.get()
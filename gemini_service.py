@@ -1,7 +1,8 @@
 import os
 import logging
 # Removed Google Gemini dependencies - using local AI service
-from typing import Optional
+from typing import List, Optional
+from intent_matcher import IntentMatcher
 
 class GeminiService:
     """Service for handling Google Gemini AI model interactions"""
@@ -12,6 +13,7 @@ class GeminiService:
         self.is_loading = False
         self.error = None
         self.model_name = "SQUAD ONE - BERYL AGENTIC BUILDER (Gemini)"
+        self.intents = None
         
         try:
             self._initialize_gemini()
@@ -25,6 +27,7 @@ class GeminiService:
         try:
             # Use local mock service instead of Gemini API
             self.model = "Local AI Assistant"
+            self.intents = IntentMatcher.load(os.environ.get('INTENTS_PATH'))
             self.is_loaded = True
             self.is_loading = False
             logging.info("Local AI service initialized successfully")
@@ -33,27 +36,30 @@ class GeminiService:
             self.error = f"Failed to initialize local service: {str(e)}"
             raise e
     
-    def generate_response(self, message: str, conversation_history: Optional[list] = None) -> str:
-        """Generate a response using local AI"""
+    def generate_response(self, message: str, conversation_history: Optional[List[dict]] = None) -> str:
+        """
+        Generate a response using local AI
+        
+        Args:
+            message: Latest user message
+            conversation_history: Recent turns, oldest first, as {'role', 'content'} dicts
+                (already bounded by the conversation context buffer). A message that
+                matches no intent ("tell me more") keeps the topic of the last user turn.
+        """
         if not self.is_loaded:
             raise RuntimeError("Local AI service not loaded")
         
         try:
             # Generate intelligent responses based on message content
-            if any(word in message.lower() for word in ['hello', 'hi', 'hey', 'greetings']):
-                return "Hello! I'm BERYL from SQUAD ONE. I'm your AI assistant for building and deploying agent applications. How can I help you today?"
-            
-            elif any(word in message.lower() for word in ['squad', 'beryl', 'build', 'agent']):
-                return "I'm here to help you with SQUAD ONE's agentic builder platform. I can assist with building AI agents, deployment strategies, and integration solutions. What would you like to work on?"
-            
-            elif any(word in message.lower() for word in ['deploy', 'deployment', 'hosting']):
-                return "I can help you deploy your applications to multiple platforms including HuggingFace Spaces, Replit, Vercel, and more. Would you like me to generate deployment configurations for your project?"
-            
-            elif any(word in message.lower() for word in ['voice', 'avatar', 'isp', 'animation']):
-                return "I can assist with THE ISP avatar system, including voice synthesis, facial animation, and lip sync technology. What aspect of avatar development are you working on?"
-            
-            else:
-                return f"I understand you're asking about: '{message}'. As BERYL from SQUAD ONE, I'm here to help with AI agent development, deployment, and integration. Could you provide more details about what you'd like to accomplish?"
+            intent = self.intents.match(message)
+            if intent is None:
+                previous = next((turn['content'] for turn in reversed(conversation_history or [])
+                                 if turn.get('role') == 'user'), None)
+                if previous:
+                    intent = self.intents.match(previous)
+            if intent is not None:
+                return intent.response
+            return self.intents.respond(message)
                 
         except Exception as e:
             logging.error(f"Local AI generation error: {e}")
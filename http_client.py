@@ -0,0 +1,174 @@
+"""
+Shared pooled HTTP client for outbound model API calls
+One keep-alive requests.Session with a bounded connection pool, exponential
+backoff retries on 503 (HuggingFace "model loading"), and a per-host circuit
+breaker that fails fast while a host keeps erroring
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; open -> half_open
+    after reset_seconds, letting one trial request through; its outcome closes
+    or re-opens the circuit
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def to_dict(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+class PooledHTTPClient:
+    """Keep-alive session with retries and per-host circuit breaking"""
+
+    def __init__(
+        self,
+        pool_size: int = None,
+        max_retries: int = None,
+        backoff: float = None,
+        timeout: float = None,
+        breaker_failures: int = None,
+        breaker_reset_seconds: float = None
+    ):
+        self.pool_size = pool_size or int(os.environ.get('HTTP_POOL_SIZE', 16))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('HTTP_MAX_RETRIES', 3))
+        self.backoff = backoff if backoff is not None else float(os.environ.get('HTTP_RETRY_BACKOFF', 0.5))
+        self.timeout = timeout or float(os.environ.get('HTTP_TIMEOUT', 15))
+        self.breaker_failures = breaker_failures or int(os.environ.get('HTTP_BREAKER_FAILURES', 5))
+        self.breaker_reset_seconds = breaker_reset_seconds or float(os.environ.get('HTTP_BREAKER_RESET_SECONDS', 30))
+
+        # Inference POSTs are safe to repeat, so 503s are retried for every method;
+        # the wait is backoff * 2^n unless the server sends Retry-After
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status_forcelist=(503,),
+            allowed_methods=None,
+            backoff_factor=self.backoff,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                              pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.failures = 0
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.breaker_failures, self.breaker_reset_seconds)
+            return breaker
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool
+
+        Raises CircuitOpenError without sending anything while the host's circuit
+        is open. 5xx responses left after retries count as failures but are
+        still returned to the caller.
+        """
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {urlparse(url).netloc}")
+
+        kwargs.setdefault('timeout', self.timeout)
+        with self._lock:
+            self.requests_sent += 1
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record_failure(breaker)
+            raise
+
+        if response.status_code >= 500:
+            self._record_failure(breaker)
+        else:
+            breaker.record_success()
+        return response
+
+    def _record_failure(self, breaker: CircuitBreaker):
+        breaker.record_failure()
+        with self._lock:
+            self.failures += 1
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'max_retries': self.max_retries,
+                'requests_sent': self.requests_sent,
+                'failures': self.failures,
+                'hosts': {host: breaker.to_dict() for host, breaker in self._breakers.items()}
+            }
+
+# Global client, created on first use
+_http_client = LazySingleton(PooledHTTPClient, 'http_client')
+
+def get_http_client():
+    """Get or create the global pooled HTTP client"""
+    return _http_client.get()
@@ -1,47 +1,218 @@
-import gradio as gr, subprocess, os
+import os, glob, fcntl, uuid, hashlib
+from ffmpeg_pool import get_ffmpeg_pool, FFmpegJobError, PoolBusyError
 
-def crop_mouth_region_ffmpeg(video_path):
+# Coordinates: h*0.45:0.75, w*0.35:0.65 (both lips INSIDE the square)
+MOUTH_CROP_FILTER = "crop=iw*0.30:ih*0.30:iw*0.35:ih*0.45,scale=256:256"
+MOUTH_CACHE_DIR = os.environ.get("LIPSYNC_CACHE_DIR", os.path.join(".cache", "lipsync"))
+MOUTH_CLIP_SECONDS = "2"
+SOURCE_VIDEO = "sync.mp4"
+
+# "two_pass": encode the mouth crop, then decode and re-encode it in the mux.
+# "single_pass": crop, scale, align audio and mux in one filtergraph (also writing the
+# crop to the cache), or stream-copy the video when a cached crop already exists.
+PIPELINE_MODES = ("two_pass", "single_pass")
+DEFAULT_PIPELINE_MODE = os.environ.get("LIPSYNC_PIPELINE_MODE", "single_pass")
+
+# (path, size, mtime_ns) -> sha256, so unchanged sources are never re-read
+_source_hashes = {}
+
+def run_ffmpeg(cmd, block=True, on_progress=None):
+    """Run an ffmpeg command on the shared worker pool; block=False raises PoolBusyError when saturated."""
+    return get_ffmpeg_pool().submit(cmd, on_progress=on_progress, block=block).result()
+
+def crop_mouth_region_ffmpeg(video_path, output_path="mouth_fixed.mp4", block=True):
     """Extract mouth region using FFmpeg - THE CRITICAL FIX."""
     if not os.path.exists(video_path):
         return False
-    
+
     # THE FIX: Precise mouth crop using FFmpeg filters
-    # Coordinates: h*0.45:0.75, w*0.35:0.65 (both lips INSIDE the square)
     cmd = [
         "ffmpeg", "-y", "-i", video_path,
-        "-vf", "crop=iw*0.30:ih*0.30:iw*0.35:ih*0.45,scale=256:256",
-        "-t", "2", "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "mouth_fixed.mp4"
+        "-vf", MOUTH_CROP_FILTER,
+        "-t", MOUTH_CLIP_SECONDS, "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        output_path
     ]
-    
+
     try:
-        subprocess.run(cmd, check=True, capture_output=True)
+        run_ffmpeg(cmd, block=block)
         print("✅ Mouth properly positioned in 256x256 square")
         return True
-    except:
+    except FFmpegJobError:
         return False
 
-def lipsync(voice_file):
+def _file_hash(path):
+    """Content hash of a file, memoised on its size and mtime."""
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _source_hashes.get(signature)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = _source_hashes[signature] = sha.hexdigest()
+    return digest
+
+def _mouth_crop_entry(video_path):
+    """(tag, key, path) of the cache entry for video_path under the current crop filter."""
+    key = hashlib.sha256(f"{_file_hash(video_path)}:{MOUTH_CROP_FILTER}".encode()).hexdigest()[:32]
+    tag = os.path.splitext(os.path.basename(video_path))[0]
+    return tag, key, os.path.join(MOUTH_CACHE_DIR, f"mouth_{tag}_{key}.mp4")
+
+def _existing_mouth_crop(video_path):
+    """Cached crop for video_path if one has already been built, without building it."""
+    if not os.path.exists(video_path):
+        return None
+    output_path = _mouth_crop_entry(video_path)[2]
+    return output_path if os.path.exists(output_path) else None
+
+def cached_mouth_crop(video_path, block=True):
+    """
+    Path of the cropped 256x256 mouth clip for video_path, encoding it only once.
+
+    Entries are keyed by source content hash plus crop filter, so editing the
+    source or the filter produces a new entry. A file lock makes concurrent
+    processes wait for one encode instead of each running their own.
+    """
+    if not os.path.exists(video_path):
+        return None
+
+    tag, key, output_path = _mouth_crop_entry(video_path)
+    if os.path.exists(output_path):
+        return output_path
+
+    os.makedirs(MOUTH_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(MOUTH_CACHE_DIR, f"mouth_{tag}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(output_path):
+            return output_path
+
+        temp_path = _mouth_crop_temp(video_path)
+        if not crop_mouth_region_ffmpeg(video_path, temp_path, block=block):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        _publish_mouth_crop(video_path, temp_path)
+
+    return output_path
+
+def _mouth_crop_temp(video_path):
+    """Unique scratch path in the cache directory for a crop being encoded."""
+    os.makedirs(MOUTH_CACHE_DIR, exist_ok=True)
+    key = _mouth_crop_entry(video_path)[1]
+    return os.path.join(MOUTH_CACHE_DIR, f".tmp_{os.getpid()}_{uuid.uuid4().hex[:8]}_{key}.mp4")
+
+def _publish_mouth_crop(video_path, temp_path):
+    """Move a finished crop into place as the cache entry for video_path."""
+    tag, _, output_path = _mouth_crop_entry(video_path)
+    os.replace(temp_path, output_path)
+
+    # Drop crops of previous versions of this source
+    for stale in glob.glob(os.path.join(MOUTH_CACHE_DIR, f"mouth_{tag}_*.mp4")):
+        if stale != output_path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+def lipsync(voice_file, output_path="out.mp4", on_progress=None, block=True, mode=None, source_video=SOURCE_VIDEO):
     if voice_file is None: return
-    
+
+    mode = mode or DEFAULT_PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown lip-sync pipeline mode: {mode}")
+
+    cache_path = None
+    if mode == "single_pass":
+        # On a cache miss the same run also writes the crop, so later requests stream-copy it
+        if os.path.exists(source_video) and not _existing_mouth_crop(source_video):
+            cache_path = _mouth_crop_temp(source_video)
+        cmd = single_pass_command(voice_file, source_video, output_path, cache_path=cache_path)
+    else:
+        cmd = two_pass_command(voice_file, source_video, output_path, block=block)
+
+    try:
+        run_ffmpeg(cmd, block=block, on_progress=on_progress)
+        if cache_path:
+            _publish_mouth_crop(source_video, cache_path)
+    finally:
+        if cache_path and os.path.exists(cache_path):
+            os.remove(cache_path)
+    return output_path
+
+def two_pass_command(voice_file, source_video, output_path, block=True):
+    """Mux against the (cached) cropped clip, re-encoding the video."""
     # THE CRITICAL FIX: Use properly cropped mouth region
-    video_source = "sync.mp4"
-    if os.path.exists("sync.mp4"):
-        if crop_mouth_region_ffmpeg("sync.mp4"):
-            video_source = "mouth_fixed.mp4"
-            print("✅ FIXED: Mouth now INSIDE the 256x256 square")
-    
-    cmd = [
+    video_source = source_video
+    mouth_clip = cached_mouth_crop(source_video, block=block)
+    if mouth_clip:
+        video_source = mouth_clip
+        print("✅ FIXED: Mouth now INSIDE the 256x256 square")
+
+    return [
       "ffmpeg","-y","-i",voice_file,"-i",video_source,
-      "-async","1","-c","libx264","-map","0:a:0?","-map","1:v:0",
-      "out.mp4"
+      "-async","1","-c:v","libx264","-c:a","aac","-map","0:a:0?","-map","1:v:0",
+      output_path
     ]
-    subprocess.run(cmd, check=True, capture_output=True)
-    return "out.mp4"
-
-gr.Interface(
-    fn=lipsync,
-    inputs=gr.Audio(type="filepath", label="upload wav"),
-    outputs=gr.Video(label="lip-sync result (fixed mouth crop)"),
-    title="Instant Lip-sync - Fixed Mouth Positioning"
-).queue().launch(debug=True)
\ No newline at end of file
+
+def single_pass_command(voice_file, source_video, output_path, cache_path=None):
+    """
+    One ffmpeg invocation: stream-copy a cached crop, or crop+scale+mux in a single filtergraph.
+
+    With cache_path, a miss also writes the crop there as a second output, encoded as
+    crop_mouth_region_ffmpeg would, for the caller to publish to the cache.
+    """
+    audio_args = ["-map", "0:a:0?", "-af", "aresample=async=1", "-c:a", "aac"]
+
+    mouth_clip = _existing_mouth_crop(source_video)
+    if mouth_clip:
+        # Already 256x256 H.264 - no video transform needed
+        return [
+            "ffmpeg", "-y", "-i", voice_file, "-i", mouth_clip,
+            "-map", "1:v:0", "-c:v", "copy", *audio_args,
+            output_path
+        ]
+
+    if not cache_path:
+        return [
+            "ffmpeg", "-y", "-i", voice_file, "-t", MOUTH_CLIP_SECONDS, "-i", source_video,
+            "-filter_complex", f"[1:v]{MOUTH_CROP_FILTER},format=yuv420p[mouth]",
+            "-map", "[mouth]", "-c:v", "libx264", *audio_args,
+            output_path
+        ]
+
+    return [
+        "ffmpeg", "-y", "-i", voice_file, "-t", MOUTH_CLIP_SECONDS, "-i", source_video,
+        "-filter_complex", f"[1:v]{MOUTH_CROP_FILTER},format=yuv420p,split=2[mouth][cache]",
+        "-map", "[mouth]", "-c:v", "libx264", *audio_args,
+        output_path,
+        "-map", "[cache]", "-c:v", "libx264", "-an",
+        cache_path
+    ]
+
+def create_lipsync_video(audio_path, output_path, mode=None):
+    """Run the lip-sync pipeline for the /api/lip-sync route, writing the video to output_path."""
+    try:
+        lipsync(audio_path, output_path, block=False, mode=mode)
+        return {'success': True, 'output_path': output_path}
+    except PoolBusyError as e:
+        return {'success': False, 'error': str(e), 'busy': True}
+    except (FFmpegJobError, ValueError) as e:
+        return {'success': False, 'error': str(e)}
+
+def lipsync_job(voice_file):
+    """Gradio entry point: each call renders into its own job workspace."""
+    if voice_file is None: return
+    from job_workspace import get_workspace_manager
+    workspace = get_workspace_manager().create()
+    return lipsync(voice_file, workspace.path_for("out.mp4"))
+
+if __name__ == "__main__":
+    import gradio as gr
+
+    gr.Interface(
+        fn=lipsync_job,
+        inputs=gr.Audio(type="filepath", label="upload wav"),
+        outputs=gr.Video(label="lip-sync result (fixed mouth crop)"),
+        title="Instant Lip-sync - Fixed Mouth Positioning"
+    ).queue(default_concurrency_limit=get_ffmpeg_pool().workers).launch(debug=True)
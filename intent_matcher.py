@@ -0,0 +1,140 @@
+"""
+Keyword intent matching for the local AI service
+Intents and responses live in a data table; matching is a single lowercase
+tokenisation pass plus hash lookups, so cost depends on message length, not intent count
+"""
+import re
+import json
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+# Inflection suffixes a keyword also matches with ('deploy' -> 'deploying', 'deployments')
+SUFFIXES = ('s', 'ed', 'er', 'ers', 'ing', 'ings', 'ment', 'ments')
+STEM_PATTERN = re.compile(r"^([a-z0-9']{3,}?)(?:ments?|ings?|ers?|ed|s)$")
+
+DEFAULT_INTENTS = [
+    {
+        'name': 'greeting',
+        'keywords': ['hello', 'hi', 'hey', 'greetings'],
+        'response': "Hello! I'm BERYL from SQUAD ONE. I'm your AI assistant for building and deploying agent applications. How can I help you today?"
+    },
+    {
+        'name': 'platform',
+        'keywords': ['squad', 'beryl', 'build', 'rebuild', 'agent', 'agentic'],
+        'response': "I'm here to help you with SQUAD ONE's agentic builder platform. I can assist with building AI agents, deployment strategies, and integration solutions. What would you like to work on?"
+    },
+    {
+        'name': 'deployment',
+        'keywords': ['deploy', 'redeploy', 'deployment', 'hosting'],
+        'response': "I can help you deploy your applications to multiple platforms including HuggingFace Spaces, Replit, Vercel, and more. Would you like me to generate deployment configurations for your project?"
+    },
+    {
+        'name': 'avatar',
+        'keywords': ['voice', 'avatar', 'isp', 'animation'],
+        'response': "I can assist with THE ISP avatar system, including voice synthesis, facial animation, and lip sync technology. What aspect of avatar development are you working on?"
+    }
+]
+
+FALLBACK_RESPONSE = "I understand you're asking about: '{message}'. As BERYL from SQUAD ONE, I'm here to help with AI agent development, deployment, and integration. Could you provide more details about what you'd like to accomplish?"
+
+
+def inflections(word: str) -> List[str]:
+    """
+    The word plus its stem with each inflection suffix
+
+    Stems shorter than three characters are not inflected, so short keywords
+    stay whole words ('hi' does not match 'his').
+    """
+    match = STEM_PATTERN.match(word)
+    stem = match.group(1) if match else word
+    if len(stem) < 3:
+        return [word]
+    return [word, stem] + [stem + suffix for suffix in SUFFIXES]
+
+
+@dataclass
+class Intent:
+    name: str
+    keywords: List[str]
+    response: str
+
+
+class IntentMatcher:
+    """
+    Matches messages against keyword intents on whole-word boundaries
+
+    Keywords may be phrases ("lip sync"), and also match in their inflected
+    forms ('deploying' hits 'deploy'; for a phrase, its last word is inflected).
+    When several intents match, the one listed first in the table wins, as with
+    the original if/elif chain.
+    """
+
+    def __init__(self, intents: List[dict], fallback_response: str = FALLBACK_RESPONSE):
+        self.intents = [Intent(item['name'], list(item['keywords']), item['response']) for item in intents]
+        self.fallback_response = fallback_response
+
+        # phrase or inflected form -> index of the first intent that lists it
+        self._lookup = {}
+        # first word of each multi-word phrase -> longest phrase length starting with it
+        self._phrase_starts = {}
+        for index, intent in enumerate(self.intents):
+            for keyword in intent.keywords:
+                words = WORD_PATTERN.findall(keyword.lower())
+                if not words:
+                    continue
+                for last in inflections(words[-1]):
+                    self._lookup.setdefault(' '.join(words[:-1] + [last]), index)
+                if len(words) > 1:
+                    self._phrase_starts[words[0]] = max(self._phrase_starts.get(words[0], 0), len(words))
+
+    @classmethod
+    def from_json(cls, path: str) -> 'IntentMatcher':
+        """Load an intent table: a list of {name, keywords, response} objects"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'IntentMatcher':
+        """Intent table from path if given and readable, else the built-in defaults"""
+        if path:
+            try:
+                return cls.from_json(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Failed to load intents from {path}, using defaults: {e}")
+        return cls(DEFAULT_INTENTS)
+
+    def match(self, message: str) -> Optional[Intent]:
+        """Highest-priority intent whose keyword appears in the message, or None"""
+        words = WORD_PATTERN.findall(message.lower())
+        lookup = self._lookup
+        best = None
+
+        for start, word in enumerate(words):
+            index = lookup.get(word)
+            if index is not None and (best is None or index < best):
+                best = index
+
+            longest = self._phrase_starts.get(word)
+            if longest:
+                phrase = word
+                for following in words[start + 1:start + longest]:
+                    phrase = f"{phrase} {following}"
+                    index = lookup.get(phrase)
+                    if index is not None and (best is None or index < best):
+                        best = index
+
+            if best == 0:
+                break
+
+        return self.intents[best] if best is not None else None
+
+    def respond(self, message: str) -> str:
+        """Canned response for the matched intent, or the fallback"""
+        intent = self.match(message)
+        if intent is not None:
+            return intent.response
+        return self.fallback_response.format(message=message)
@@ -0,0 +1,275 @@
+"""
+Asynchronous job runner for long media work (lip-sync, CSM speech)
+Submitting returns a job id immediately; work runs on a bounded background executor
+and callers poll /api/jobs/<id> for state, progress and the result URL. Job states
+are kept in the database, so a poll can be answered by any web worker
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from lazy_singleton import LazySingleton
+from models import MediaJob
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already queued or running"""
+
+
+class Job:
+    """State of a single background job"""
+
+    def __init__(self, kind: str, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.state = 'queued'  # queued -> running -> succeeded | failed
+        self.progress = 0.0
+        self.stage = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Called after each progress report, to persist it
+        self._on_progress = None
+
+    @classmethod
+    def from_row(cls, row: MediaJob) -> 'Job':
+        job = cls(row.kind, row.id)
+        job.state = row.state
+        job.stage = row.stage
+        job.progress = row.progress
+        job.result = json.loads(row.result) if row.result is not None else None
+        job.error = row.error
+        job.created_at = row.created_at
+        job.started_at = row.started_at
+        job.finished_at = row.finished_at
+        return job
+
+    def set_progress(self, progress: float, stage: str = None):
+        """Report progress from inside the job (0.0 - 1.0)"""
+        self.progress = max(self.progress, min(1.0, float(progress)))
+        if stage:
+            self.stage = stage
+        if self._on_progress:
+            self._on_progress(self)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('succeeded', 'failed')
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'stage': self.stage,
+            'progress': round(self.progress, 3),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Bounded background executor whose job states live in the database
+
+    A job runs in the process that accepted it, but every state change is
+    written to its MediaJob row (progress at most every save_interval seconds),
+    so polls that land on another worker, or arrive after a restart, still
+    find it. While this process holds unfinished jobs a heartbeat keeps their
+    rows fresh; a row left unfinished and not refreshed for stale_seconds
+    belonged to a worker that stopped, and is reported failed.
+    """
+
+    def __init__(self, app, workers: int = None, max_pending: int = None, ttl_seconds: float = None,
+                 save_interval: float = None, stale_seconds: float = None):
+        self.app = app
+        self.workers = workers or int(os.environ.get('MEDIA_JOB_WORKERS', 2))
+        # Per process: each web worker bounds its own executor
+        self.max_pending = max_pending or int(os.environ.get('MEDIA_JOB_QUEUE_SIZE', 32))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            float(os.environ.get('MEDIA_JOB_TTL', 3600))
+        self.save_interval = save_interval if save_interval is not None else \
+            float(os.environ.get('MEDIA_JOB_SAVE_INTERVAL', 1.0))
+        self.stale_seconds = stale_seconds or float(os.environ.get('MEDIA_JOB_STALE_SECONDS', 60))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media-job')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # This process's unfinished jobs, and when each was last written
+        self._jobs = {}
+        self._saved_at = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def submit(self, kind: str, func: Callable, *args, job_id: str = None, **kwargs) -> Job:
+        """
+        Run func(job, *args, **kwargs) in the background
+
+        func's return value (JSON-serialisable) becomes the job result; exceptions mark the job failed.
+        Raises QueueFullError when max_pending jobs are already queued or running.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Media job queue full ({self.max_pending} jobs pending)")
+
+        job = Job(kind, job_id)
+        job._on_progress = self._progress
+        try:
+            # The row must exist before the id is handed out, or a poll could 404
+            self._save(job, prune=True)
+            with self._lock:
+                self._jobs[job.id] = job
+                self._start_heartbeat()
+            self._executor.submit(self._run, job, func, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._slots.release()
+            raise
+        return job
+
+    def _run(self, job: Job, func: Callable, args, kwargs):
+        job.state = 'running'
+        job.stage = 'running'
+        job.started_at = time.time()
+        self._save_quietly(job)
+        try:
+            result = func(job, *args, **kwargs)
+            json.dumps(result)  # stored as JSON, so an unserialisable result fails here
+            job.result = result
+            job.progress = 1.0
+            job.stage = 'done'
+            job.state = 'succeeded'
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {e}")
+            job.error = str(e)
+            job.stage = 'failed'
+            job.state = 'failed'
+        finally:
+            job.finished_at = time.time()
+            self._save_quietly(job)
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                self._saved_at.pop(job.id, None)
+            self._slots.release()
+
+    def _progress(self, job: Job):
+        with self._lock:
+            due = time.time() - self._saved_at.get(job.id, 0) >= self.save_interval
+        if due:
+            self._save_quietly(job)
+
+    def _save(self, job: Job, prune: bool = False):
+        """Write a job's state to its row, optionally dropping expired rows"""
+        now = time.time()
+        with self.app.app_context():
+            with Session(db.engine) as session:
+                session.merge(MediaJob(
+                    id=job.id, kind=job.kind, state=job.state, stage=job.stage, progress=job.progress,
+                    result=json.dumps(job.result) if job.result is not None else None, error=job.error,
+                    created_at=job.created_at, started_at=job.started_at, finished_at=job.finished_at, updated_at=now
+                ))
+                if prune:
+                    cutoff = now - self.ttl_seconds
+                    session.execute(delete(MediaJob).where(or_(
+                        MediaJob.finished_at < cutoff,
+                        and_(MediaJob.finished_at.is_(None), MediaJob.updated_at < cutoff)
+                    )))
+                session.commit()
+        with self._lock:
+            self._saved_at[job.id] = now
+
+    def _save_quietly(self, job: Job):
+        # A failed state write must not fail the job itself; the heartbeat keeps its row alive
+        try:
+            self._save(job)
+        except Exception as e:
+            logger.error(f"Failed to save {job.kind} job {job.id}: {e}")
+
+    def _start_heartbeat(self):
+        """Start refreshing this process's unfinished rows (lock held)"""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name='media-job-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(self.stale_seconds / 4)
+            with self._lock:
+                job_ids = list(self._jobs)
+            if not job_ids:
+                continue
+            try:
+                with self.app.app_context():
+                    with Session(db.engine) as session:
+                        session.execute(update(MediaJob)
+                                        .where(MediaJob.id.in_(job_ids), MediaJob.finished_at.is_(None))
+                                        .values(updated_at=time.time()))
+                        session.commit()
+            except Exception as e:
+                logger.error(f"Media job heartbeat failed: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job's current state from this process or the database; None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        with self.app.app_context():
+            with Session(db.engine) as session:
+                row = session.get(MediaJob, job_id)
+                if row is None:
+                    return None
+                job = Job.from_row(row)
+                updated_at = row.updated_at
+
+        now = time.time()
+        if job.finished:
+            return job if job.finished_at >= now - self.ttl_seconds else None
+        if updated_at < now - self.stale_seconds:
+            job.state = job.stage = 'failed'
+            job.error = 'Job was lost: the worker running it stopped'
+            job.finished_at = updated_at
+        return job
+
+    def get_stats(self) -> dict:
+        """Get executor sizing and job counts by state"""
+        with self.app.app_context():
+            with Session(db.engine) as session:
+                counts = dict(session.execute(
+                    select(MediaJob.state, func.count()).group_by(MediaJob.state)
+                ).all())
+        with self._lock:
+            local = len(self._jobs)
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'local_pending': local,
+            'jobs': counts
+        }
+
+def _create_job_manager():
+    from app import app
+    return JobManager(app)
+
+# Global job manager, created on first use
+_job_manager = LazySingleton(_create_job_manager, 'job_manager')
+
+def get_job_manager():
+    """Get or create the global job manager"""
+    return _job_manager.get()
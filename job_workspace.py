@@ -0,0 +1,207 @@
+"""
+Per-job scratch directories for media pipelines
+Each job gets its own directory (on tmpfs when available) that is removed after a TTL
+by a background sweep, with a cap on the total space all workspaces may use
+"""
+import os
+import re
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: creates are serialised within this process only
+    fcntl = None
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class WorkspaceFullError(RuntimeError):
+    """Raised when creating a workspace would exceed the disk usage cap"""
+
+
+def _default_root() -> str:
+    """Prefer tmpfs (/dev/shm) so intermediate media never touches the disk"""
+    shm = '/dev/shm'
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return os.path.join(shm, 'squad-one-jobs')
+    return os.path.join(tempfile.gettempdir(), 'squad-one-jobs')
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                continue
+    return total
+
+
+class JobWorkspace:
+    """A unique directory owned by a single job"""
+
+    def __init__(self, job_id: str, path: str):
+        self.id = job_id
+        self.path = path
+
+    def path_for(self, filename: str) -> str:
+        """Absolute path of a file inside the workspace"""
+        return os.path.join(self.path, os.path.basename(filename))
+
+    def touch(self):
+        """Extend the workspace's lifetime"""
+        os.utime(self.path)
+
+    def size(self) -> int:
+        return _directory_size(self.path)
+
+
+class WorkspaceManager:
+    """
+    Creates, looks up and expires job workspaces
+
+    Every workspace counts as at least reserve_bytes towards the cap from the
+    moment it is created, so concurrent creates (threads here, or other
+    workers sharing the root, through a file lock) cannot all pass the check
+    before any of them has written its files.
+    """
+
+    def __init__(self, root: str = None, ttl_seconds: float = None, max_bytes: int = None,
+                 reserve_bytes: int = None, sweep_seconds: float = None):
+        self.root = root or os.environ.get('JOB_WORKSPACE_ROOT') or _default_root()
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else \
+            float(os.environ.get('JOB_WORKSPACE_TTL', 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(os.environ.get('JOB_WORKSPACE_MAX_MB', 2048)) * 1024 * 1024
+        self.reserve_bytes = reserve_bytes if reserve_bytes is not None else \
+            int(os.environ.get('JOB_WORKSPACE_RESERVE_MB', 64)) * 1024 * 1024
+        self.sweep_seconds = sweep_seconds or float(os.environ.get('JOB_WORKSPACE_SWEEP_SECONDS', 300))
+
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._start_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def start(self):
+        """Sweep expired workspaces every sweep_seconds in the background"""
+        with self._start_lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._run, name='workspace-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Job workspace sweep failed: {e}")
+            time.sleep(self.sweep_seconds)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the thread lock and, where available, an exclusive lock on the root shared by all workers"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _workspace_names(self):
+        return [name for name in os.listdir(self.root) if JOB_ID_PATTERN.match(name)]
+
+    def _usage(self) -> int:
+        """Bytes counted against the cap: each workspace's size, but at least its reservation"""
+        return sum(max(_directory_size(self._path(name)), self.reserve_bytes) for name in self._workspace_names())
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def create(self) -> JobWorkspace:
+        """Create a fresh workspace, sweeping expired ones and reserving its space under the cap"""
+        with self._locked():
+            self._sweep()
+            usage = self._usage()
+            if usage + self.reserve_bytes > self.max_bytes:
+                raise WorkspaceFullError(
+                    f"Job workspaces use or reserve {usage // (1024 * 1024)}MB of {self.max_bytes // (1024 * 1024)}MB"
+                )
+
+            job_id = uuid.uuid4().hex
+            path = self._path(job_id)
+            os.makedirs(path)
+            return JobWorkspace(job_id, path)
+
+    def get(self, job_id: str) -> Optional[JobWorkspace]:
+        """Look up an existing workspace; ids are validated so they cannot escape the root"""
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        path = self._path(job_id)
+        if not os.path.isdir(path):
+            return None
+        return JobWorkspace(job_id, path)
+
+    def release(self, job_id: str):
+        """Remove a workspace immediately"""
+        if JOB_ID_PATTERN.match(job_id or ''):
+            shutil.rmtree(self._path(job_id), ignore_errors=True)
+
+    def sweep(self) -> int:
+        """Remove workspaces older than the TTL and return how many were removed"""
+        with self._locked():
+            return self._sweep()
+
+    def _sweep(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for name in self._workspace_names():
+            path = self._path(name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} expired job workspaces")
+        return removed
+
+    def get_stats(self) -> dict:
+        """Get workspace location and usage"""
+        return {
+            'root': self.root,
+            'workspaces': len(self._workspace_names()),
+            'bytes_used': _directory_size(self.root),
+            'bytes_reserved': self._usage(),
+            'max_bytes': self.max_bytes,
+            'reserve_bytes': self.reserve_bytes,
+            'ttl_seconds': self.ttl_seconds
+        }
+
+def _start_workspace_manager():
+    manager = WorkspaceManager()
+    manager.start()
+    return manager
+
+# Global workspace manager, created and started on first use
+_workspace_manager = LazySingleton(_start_workspace_manager, 'workspace_manager')
+
+def get_workspace_manager():
+    """Get or create (and start) the global workspace manager"""
+    return _workspace_manager.get()
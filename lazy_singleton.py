@@ -0,0 +1,61 @@
+"""
+Thread-safe lazy singletons for global service instances
+The instance is built on first get(); concurrent first callers block on the
+one in-flight build instead of each constructing their own copy
+"""
+import time
+import logging
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class LazySingleton(Generic[T]):
+    """
+    Holds one instance of whatever factory builds, created on first use
+
+    Double-checked locking: once built, get() is a plain attribute read. If the
+    factory raises, nothing is stored and the next caller tries again.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: Optional[str] = None):
+        self._factory = factory
+        self.name = name or getattr(factory, '__qualname__', repr(factory))
+        self._instance = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_count = 0
+        self.load_seconds = None
+
+    def get(self) -> T:
+        """Return the instance, building it if this is the first call"""
+        if self._loaded:
+            return self._instance
+
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                instance = self._factory()
+                self.load_seconds = time.perf_counter() - start
+                self.load_count += 1
+                self._instance = instance
+                # Publish only after the instance is in place for the lock-free fast path
+                self._loaded = True
+                logger.info(f"Created {self.name} in {self.load_seconds:.2f}s")
+        return self._instance
+
+    def peek(self) -> Optional[T]:
+        """The instance if it has been built, else None; never builds"""
+        return self._instance if self._loaded else None
+
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def reset(self):
+        """Drop the instance so the next get() builds a new one"""
+        with self._lock:
+            self._instance = None
+            self._loaded = False
@@ -2,8 +2,14 @@ from app import db
 from datetime import datetime
 
 class ChatMessage(db.Model):
+    # History reads filter on session_id and page on (timestamp, id), so one
+    # composite index serves both the filter and the ordering
+    __table_args__ = (
+        db.Index('ix_chat_message_session_timestamp', 'session_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(64), nullable=False, index=True)
+    session_id = db.Column(db.String(64), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -16,3 +22,23 @@ class ChatMessage(db.Model):
             'content': self.content,
             'timestamp': self.timestamp.isoformat()
         }
+
+class ClearedSession(db.Model):
+    """Tombstone for a cleared chat session whose messages are still being purged"""
+    session_id = db.Column(db.String(64), primary_key=True)
+    cleared_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class MediaJob(db.Model):
+    """State of a background media job, so any web worker can answer a poll for it"""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    state = db.Column(db.String(16), nullable=False)  # queued -> running -> succeeded | failed
+    stage = db.Column(db.String(32), nullable=False)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    # Unix times, as reported by /api/jobs; updated_at is refreshed while the owning worker is alive
+    created_at = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.Float)
+    finished_at = db.Column(db.Float, index=True)
+    updated_at = db.Column(db.Float, nullable=False)
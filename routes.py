@@ -1,32 +1,41 @@
 import os
+import json
 import uuid
 import time
 import logging
-from flask import render_template, request, jsonify, session
+from datetime import datetime
+from flask import render_template, request, jsonify, session, Response, stream_with_context, send_file
+from sqlalchemy import select, tuple_
 from app import app, db
 from models import ChatMessage
+from conversation_context import get_context_store
+from chat_persistence import get_turn_writer
+from service_registry import services
 
-# Try to use Gemini first, then fallback to transformers model, then mock
-model_service = None
-
-try:
-    from gemini_service import GeminiService
-    model_service = GeminiService()
-    logging.info("Using Gemini AI service")
-except Exception as e:
-    logging.warning(f"Gemini service failed: {e}")
+def _create_model_service():
+    """Try to use Gemini first, then fallback to transformers model, then mock"""
     try:
-        from model_service import ModelService
-        model_service = ModelService()
-        # Check if the real model service has transformers available
-        if model_service.error and "transformers" in model_service.error.lower():
-            raise ImportError("Transformers not available")
-        logging.info("Using HuggingFace transformers model service")
-    except ImportError:
-        # Fall back to mock service for demonstration
-        logging.warning("Using mock model service - install torch and transformers for real AI model")
-        from mock_model_service import MockModelService
-        model_service = MockModelService()
+        from gemini_service import GeminiService
+        model_service = GeminiService()
+        logging.info("Using Gemini AI service")
+    except Exception as e:
+        logging.warning(f"Gemini service failed: {e}")
+        try:
+            from model_service import ModelService
+            model_service = ModelService()
+            # Check if the real model service has transformers available
+            if model_service.error and "transformers" in model_service.error.lower():
+                raise ImportError("Transformers not available")
+            logging.info("Using HuggingFace transformers model service")
+        except ImportError:
+            # Fall back to mock service for demonstration
+            logging.warning("Using mock model service - install torch and transformers for real AI model")
+            from mock_model_service import MockModelService
+            model_service = MockModelService()
+    return model_service
+
+# Model service is constructed on first use (or by the background pre-warm)
+services.register('model', _create_model_service)
 
 @app.route('/')
 def index():
@@ -87,48 +96,127 @@ def chat():
         
         session_id = session.get('session_id', str(uuid.uuid4()))
         
-        # Save user message
-        user_msg = ChatMessage()
-        user_msg.session_id = session_id
-        user_msg.role = 'user'
-        user_msg.content = user_message
-        db.session.add(user_msg)
-        db.session.commit()
+        # Recent turns come from the in-memory context buffer, not a history query
+        context_store = get_context_store()
+        history = context_store.get_history(session_id)
+        
+        user_timestamp = datetime.utcnow()
         
-        # Get model response
+        # Get model response (no database connection is held while it runs)
         try:
-            assistant_response = model_service.generate_response(user_message, session_id)
+            assistant_response = services.get('model').generate_response(user_message, history)
         except Exception as e:
             logging.error(f"Model generation error: {str(e)}")
             return jsonify({'error': f'Model generation failed: {str(e)}'}), 500
         
-        # Save assistant message
-        assistant_msg = ChatMessage()
-        assistant_msg.session_id = session_id
-        assistant_msg.role = 'assistant'
-        assistant_msg.content = assistant_response
-        db.session.add(assistant_msg)
-        db.session.commit()
+        # Persist both messages of the turn together
+        user_dict, assistant_dict = get_turn_writer().write_turn(
+            session_id, user_message, assistant_response, user_timestamp
+        )
+        context_store.append(session_id, 'user', user_message)
+        context_store.append(session_id, 'assistant', assistant_response)
         
         return jsonify({
-            'user_message': user_msg.to_dict(),
-            'assistant_message': assistant_msg.to_dict()
+            'user_message': user_dict,
+            'assistant_message': assistant_dict
         })
         
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+HISTORY_DEFAULT_LIMIT = 100
+HISTORY_MAX_LIMIT = 500
+
+def _history_cursor(session_id, message_id):
+    """(timestamp, id) keyset position of a message in this session, or None"""
+    row = db.session.execute(
+        select(ChatMessage.timestamp, ChatMessage.id)
+        .where(ChatMessage.id == message_id, ChatMessage.session_id == session_id)
+    ).first()
+    return tuple(row) if row else None
+
+def _stream_history(session_id, after_position=None, before_position=None):
+    """Yield NDJSON lines for a session from a server-side cursor, oldest first, between optional bounds"""
+    query = (select(ChatMessage.id, ChatMessage.session_id, ChatMessage.role,
+                    ChatMessage.content, ChatMessage.timestamp)
+             .where(ChatMessage.session_id == session_id)
+             .order_by(ChatMessage.timestamp, ChatMessage.id)
+             .execution_options(yield_per=500))
+    if after_position:
+        query = query.where(tuple_(ChatMessage.timestamp, ChatMessage.id) > after_position)
+    if before_position:
+        query = query.where(tuple_(ChatMessage.timestamp, ChatMessage.id) < before_position)
+    
+    # Plain column rows are not tracked by the ORM identity map, so memory stays flat
+    for row in db.session.execute(query):
+        yield json.dumps({
+            'id': row.id,
+            'session_id': row.session_id,
+            'role': row.role,
+            'content': row.content,
+            'timestamp': row.timestamp.isoformat()
+        }) + '\n'
+
 @app.route('/api/history')
 def get_history():
-    """Get chat history for current session"""
+    """
+    Get chat history for current session
+    
+    Keyset-paginated on (timestamp, id): without a cursor the latest `limit`
+    messages are returned; `before=<id>` pages backwards and `after=<id>`
+    forwards. Pages are always oldest first. `format=ndjson` streams the whole
+    history one message per line, bounded by the cursor if one is given.
+    """
     try:
         session_id = session.get('session_id')
         if not session_id:
-            return jsonify({'messages': []})
+            return jsonify({'messages': [], 'has_more': False})
+        
+        before = request.args.get('before', type=int)
+        after = request.args.get('after', type=int)
+        if before is not None and after is not None:
+            return jsonify({'error': 'Use either before or after, not both'}), 400
+        
+        position = None
+        if before is not None or after is not None:
+            position = _history_cursor(session_id, before if before is not None else after)
+            if position is None:
+                return jsonify({'error': 'Unknown cursor'}), 400
+        
+        if request.args.get('format') == 'ndjson':
+            return Response(
+                stream_with_context(_stream_history(session_id,
+                                                    after_position=position if after is not None else None,
+                                                    before_position=position if before is not None else None)),
+                mimetype='application/x-ndjson'
+            )
+        
+        limit = min(max(request.args.get('limit', HISTORY_DEFAULT_LIMIT, type=int), 1), HISTORY_MAX_LIMIT)
+        keyset = tuple_(ChatMessage.timestamp, ChatMessage.id)
+        query = ChatMessage.query.filter_by(session_id=session_id)
+        
+        if after is not None:
+            query = query.filter(keyset > position).order_by(ChatMessage.timestamp, ChatMessage.id)
+            messages = query.limit(limit + 1).all()
+        else:
+            if before is not None:
+                query = query.filter(keyset < position)
+            query = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+            messages = query.limit(limit + 1).all()
+        
+        # One extra row tells us whether another page exists
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if after is None:
+            messages.reverse()
         
-        messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp).all()
-        return jsonify({'messages': [msg.to_dict() for msg in messages]})
+        return jsonify({
+            'messages': [msg.to_dict() for msg in messages],
+            'has_more': has_more,
+            'before': messages[0].id if messages else before,
+            'after': messages[-1].id if messages else after
+        })
         
     except Exception as e:
         logging.error(f"History error: {str(e)}")
@@ -140,8 +228,10 @@ def clear_chat():
     try:
         session_id = session.get('session_id')
         if session_id:
-            ChatMessage.query.filter_by(session_id=session_id).delete()
-            db.session.commit()
+            # Tombstone only; rows are deleted in small background batches
+            from chat_maintenance import mark_session_cleared
+            mark_session_cleared(session_id)
+            get_context_store().clear(session_id)
         
         # Generate new session ID
         session['session_id'] = str(uuid.uuid4())
@@ -156,7 +246,7 @@ def clear_chat():
 def model_status():
     """Check model loading status"""
     try:
-        status = model_service.get_status()
+        status = services.get('model').get_status()
         return jsonify(status)
     except Exception as e:
         logging.error(f"Status error: {str(e)}")
@@ -174,9 +264,17 @@ def hf_chat():
         if not user_message:
             return jsonify({'error': 'Empty message'}), 400
         
-        # Use local model service for chat
+        # Use local model service for chat, with the session's recent turns as context
+        session_id = session.get('session_id')
+        context_store = get_context_store()
+        history = context_store.get_history(session_id)
+        
         try:
-            response_text = model_service.generate_response(user_message, [])
+            response_text = services.get('model').generate_response(user_message, history)
+            
+            # Avatar conversations are not persisted, so they only live in the context buffer
+            context_store.append(session_id, 'user', user_message, memory_only=True)
+            context_store.append(session_id, 'assistant', response_text.strip(), memory_only=True)
             
             return jsonify({
                 'response': response_text.strip(),
@@ -230,10 +328,36 @@ def local_speech():
         logging.error(f"Speech synthesis error: {str(e)}")
         return jsonify({'error': f'Speech synthesis failed: {str(e)}'}), 500
 
+def _wav_duration_seconds(path):
+    """Duration of a WAV upload, or None when it is some other format"""
+    import wave
+    try:
+        with wave.open(path, 'rb') as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except Exception:
+        return None
+
+def _lip_sync_job(job, audio_path, output_path, mode):
+    from instant_lipsync import lipsync
+    
+    expected_seconds = _wav_duration_seconds(audio_path)
+    
+    def on_progress(progress):
+        # out_time_us is how far into the output FFmpeg has written
+        if expected_seconds:
+            seconds = int(progress.get('out_time_us') or 0) / 1_000_000
+            job.set_progress(min(0.99, seconds / expected_seconds), 'rendering')
+    
+    job.set_progress(0.05, 'rendering')
+    lipsync(audio_path, output_path, on_progress=on_progress, mode=mode)
+    return {'video_url': f'/api/lip-sync/{job.id}/video'}
+
 @app.route('/api/lip-sync', methods=['POST'])
 def local_lip_sync():
     """Local lip sync processing endpoint"""
     try:
+        from job_workspace import get_workspace_manager, WorkspaceFullError
+        
         # Handle file uploads
         if 'audio' not in request.files or 'image' not in request.files:
             return jsonify({'error': 'Audio and image files required'}), 400
@@ -241,32 +365,49 @@ def local_lip_sync():
         audio_file = request.files['audio']
         image_file = request.files['image']
         
-        # Save temporary files
-        import tempfile
-        import os
+        # Every job gets its own workspace so concurrent requests never share filenames
+        workspaces = get_workspace_manager()
+        try:
+            workspace = workspaces.create()
+        except WorkspaceFullError as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
         
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as audio_temp:
-            audio_file.save(audio_temp.name)
-            audio_path = audio_temp.name
+        audio_path = workspace.path_for('input.wav')
+        audio_file.save(audio_path)
+        image_file.save(workspace.path_for('input.jpg'))
+        mode = request.form.get('mode')
         
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as image_temp:
-            image_file.save(image_temp.name)
-            image_path = image_temp.name
+        if request.form.get('async', '').lower() in ('1', 'true', 'yes'):
+            from job_queue import get_job_manager, QueueFullError
+            try:
+                get_job_manager().submit(
+                    'lip-sync', _lip_sync_job, audio_path, workspace.path_for('output.mp4'), mode,
+                    job_id=workspace.id
+                )
+            except QueueFullError as e:
+                workspaces.release(workspace.id)
+                return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+            return jsonify({
+                'status': 'accepted',
+                'job_id': workspace.id,
+                'status_url': f'/api/jobs/{workspace.id}'
+            }), 202
         
         # Use instant lip sync
         from instant_lipsync import create_lipsync_video
-        result = create_lipsync_video(audio_path, 'output_lipsync.mp4')
-        
-        # Clean up temporary files
-        os.unlink(audio_path)
-        os.unlink(image_path)
+        result = create_lipsync_video(audio_path, workspace.path_for('output.mp4'), mode=mode)
         
         if result['success']:
             return jsonify({
-                'video_url': f'/static/{result["output_path"]}',
+                'job_id': workspace.id,
+                'video_url': f'/api/lip-sync/{workspace.id}/video',
                 'status': 'success',
                 'message': 'Lip sync video created successfully'
             })
+        
+        workspaces.release(workspace.id)
+        if result.get('busy'):
+            return jsonify({'error': result['error']}), 503, {'Retry-After': '5'}
         else:
             return jsonify({'error': result['error']}), 500
             
@@ -274,6 +415,33 @@ def local_lip_sync():
         logging.error(f"Lip sync error: {str(e)}")
         return jsonify({'error': f'Lip sync failed: {str(e)}'}), 500
 
+@app.route('/api/lip-sync/<job_id>/video')
+def lip_sync_video(job_id):
+    """Serve the video produced by a lip sync job"""
+    from job_workspace import get_workspace_manager
+    
+    workspace = get_workspace_manager().get(job_id)
+    if workspace is None or not os.path.exists(workspace.path_for('output.mp4')):
+        return jsonify({'error': 'Unknown or expired lip sync job'}), 404
+    
+    return send_file(workspace.path_for('output.mp4'), mimetype='video/mp4')
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll the state, progress and result of a background media job"""
+    try:
+        from job_queue import get_job_manager
+        
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown or expired job'}), 404
+        
+        return jsonify(job.to_dict())
+        
+    except Exception as e:
+        logging.error(f"Job status error: {str(e)}")
+        return jsonify({'error': f'Job status failed: {str(e)}'}), 500
+
 @app.route('/api/gemini-chat', methods=['POST'])
 def gemini_chat():
     """Local AI chat endpoint replacing external Gemini for THE ISP"""
@@ -288,7 +456,7 @@ def gemini_chat():
         
         # Use local model service for voice agent conversations
         try:
-            response_text = model_service.generate_response(user_message, [])
+            response_text = services.get('model').generate_response(user_message, [])
             
             return jsonify({
                 'response': response_text.strip(),
@@ -320,6 +488,130 @@ def gemini_chat():
         logging.error(f"Local Voice Chat error: {str(e)}")
         return jsonify({'error': f'Local voice chat error: {str(e)}'}), 500
 
+def _face_swap_timeline(timeline, emotion, stream, ordered, response_format, avatar=None, avatar_id=None):
+    """
+    Render a phoneme timeline
+    
+    The avatar is the one uploaded to /api/face-swap/avatar and named by
+    avatar_id, or the base64 image sent with the request, or else the server's
+    default. Frames are raw image bytes until this point.
+    format=json (default) returns them base64-encoded, or as NDJSON lines while
+    they complete with stream; format=multipart streams them as binary
+    multipart/mixed parts.
+    """
+    import base64
+    from face_swap_service import image_mimetype, timeline_error
+    
+    # Reject malformed entries up front; once a stream has started, errors can no longer be a 400
+    error = timeline_error(timeline)
+    if error:
+        return jsonify({'error': error}), 400
+    if not isinstance(emotion, str):
+        return jsonify({'error': 'emotion must be a string'}), 400
+    if response_format not in ('json', 'multipart'):
+        return jsonify({'error': f'Unsupported format: {response_format}'}), 400
+    
+    service = services.get('face_swap')
+    if avatar_id:
+        source = service.get_source_face(avatar_id)
+        if source is None:
+            return jsonify({'error': 'Unknown or expired avatar_id; upload the avatar again'}), 404
+    elif avatar:
+        try:
+            source = service.load_source_face(base64.b64decode(avatar, validate=True))
+        except (TypeError, ValueError, OSError):
+            return jsonify({'error': 'avatar must be a base64-encoded image'}), 400
+    else:
+        source = service.source
+    if source is None:
+        return jsonify({'error': 'No avatar; upload one to /api/face-swap/avatar and send its avatar_id, '
+                                 'or send avatar'}), 400
+    
+    frames = service.iter_timeline(timeline, emotion=emotion, ordered=ordered, source=source)
+    
+    def frame_entry(index, image):
+        entry = timeline[index] if isinstance(timeline[index], dict) else {'phoneme': timeline[index]}
+        return {
+            **entry,
+            'index': index,
+            'image': base64.b64encode(image).decode('ascii') if image is not None else None,
+            'mimetype': image_mimetype(image) if image is not None else None
+        }
+    
+    if response_format == 'multipart':
+        boundary = uuid.uuid4().hex
+        
+        def generate_parts():
+            for index, image in frames:
+                entry = timeline[index] if isinstance(timeline[index], dict) else {'phoneme': timeline[index]}
+                image = image or b''
+                headers = (f"--{boundary}\r\n"
+                           f"Content-Type: {image_mimetype(image) if image else 'application/octet-stream'}\r\n"
+                           f"Content-Length: {len(image)}\r\n"
+                           f"X-Frame-Index: {index}\r\n"
+                           f"X-Phoneme: {entry.get('phoneme', '')}\r\n")
+                if not image:
+                    headers += "X-Frame-Error: render failed\r\n"
+                yield (headers + "\r\n").encode('ascii')
+                yield image
+                yield b"\r\n"
+            yield f"--{boundary}--\r\n".encode('ascii')
+        
+        return Response(stream_with_context(generate_parts()), mimetype=f'multipart/mixed; boundary={boundary}')
+    
+    if stream:
+        def generate():
+            for index, image in frames:
+                yield json.dumps(frame_entry(index, image)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    start = time.perf_counter()
+    # Encode each frame as it arrives so its bytes are freed before the next one
+    entries = [None] * len(timeline)
+    for index, image in frames:
+        entries[index] = frame_entry(index, image)
+    return jsonify({
+        'success': all(entry['image'] is not None for entry in entries),
+        'frames': entries,
+        'render_ms': round((time.perf_counter() - start) * 1000, 1)
+    })
+
+@app.route('/api/face-swap/avatar', methods=['POST'])
+def face_swap_avatar():
+    """Upload an avatar face and pre-render its phoneme faces; /api/face-swap animates it by avatar_id"""
+    try:
+        import base64
+        
+        # Multipart upload ('image' file) or JSON {'image': base64}
+        if 'image' in request.files:
+            image_data = request.files['image'].read()
+        else:
+            data = request.get_json(silent=True) or {}
+            if not data.get('image'):
+                return jsonify({'error': 'Image file or base64 image required'}), 400
+            try:
+                image_data = base64.b64decode(data['image'], validate=True)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'image must be base64-encoded'}), 400
+        
+        service = services.get('face_swap')
+        try:
+            source = service.load_source_face(image_data)
+        except OSError:
+            return jsonify({'error': 'Could not read the image'}), 400
+        
+        return jsonify({
+            'success': True,
+            'avatar_id': source.hash,
+            'width': int(source.image.shape[1]),
+            'height': int(source.image.shape[0]),
+            'atlas_complete': service.atlas.is_complete(source.hash)
+        })
+        
+    except Exception as e:
+        logging.error(f"Face swap avatar error: {str(e)}")
+        return jsonify({'error': f'Avatar upload failed: {str(e)}'}), 500
+
 @app.route('/api/face-swap', methods=['POST'])
 def face_swap():
     """Local face swap endpoint for avatar animation"""
@@ -329,6 +621,12 @@ def face_swap():
         emotion = data.get('emotion', 'friendly')
         intensity = data.get('intensity', 0.5)
         
+        # Timeline form: render a whole utterance's phonemes concurrently
+        timeline = data.get('timeline')
+        if timeline is not None:
+            return _face_swap_timeline(timeline, emotion, data.get('stream', False), data.get('ordered', True),
+                                       data.get('format', 'json'), data.get('avatar'), data.get('avatar_id'))
+        
         # For demonstration, return success status
         # In production, this would integrate with actual face swap technology
         return jsonify({
@@ -483,11 +781,191 @@ def docker_integration():
         logging.error(f"Docker integration error: {str(e)}")
         return jsonify({'error': f'Docker error: {str(e)}'}), 500
 
+def _csm_warming_up():
+    """(payload, status) 503 while the CSM model is still loading or warming, else None"""
+    from csm_warmup import get_csm_warmup
+    
+    warmup = get_csm_warmup()
+    if not warmup.is_pending():
+        return None
+    return {
+        'error': 'CSM is warming up',
+        'warmup': warmup.get_status(),
+        'retry_after': warmup.retry_after
+    }, 503
+
+def _csm_wav(text, speaker_id, max_duration, temperature, wait_ready, persist):
+    """
+    WAV bytes for a request, from the cache or freshly generated
+    
+    Returns (wav_data, info, None) or (None, None, (error_payload, status)). Cache
+    misses during warm-up return 503 unless wait_ready, which blocks until the
+    model is loaded. With persist=True the returned cache key is on disk, so
+    its URL resolves; persist=False keeps new audio in the memory tier only.
+    """
+    from tts_cache import get_tts_cache, make_cache_key
+    
+    # Replays of known text are served from the cache without touching the model
+    tts_cache = get_tts_cache()
+    cache_key = make_cache_key(text, speaker_id, temperature, max_duration)
+    cached_audio = tts_cache.get(cache_key, persist=persist)
+    if cached_audio is not None:
+        return cached_audio, {'cache_key': cache_key, 'cached': True, 'encode_ms': 0.0}, None
+    
+    if not wait_ready:
+        warming_up = _csm_warming_up()
+        if warming_up:
+            return None, None, warming_up
+    
+    # Get CSM agent
+    csm_agent = services.get('csm')
+    
+    if not csm_agent.is_available():
+        return None, None, ({
+            'error': 'CSM not available',
+            'details': csm_agent.error
+        }, 500)
+    
+    # Generate speech through the micro-batching scheduler so concurrent callers share model passes
+    audio = services.get('csm_scheduler').generate_speech(
+        text=text,
+        speaker_id=speaker_id,
+        max_duration_ms=max_duration,
+        temperature=temperature
+    )
+    
+    if audio is None:
+        return None, None, ({'error': 'Speech generation failed'}, 500)
+    
+    from csm_integration import pcm16_bytes
+    from audio_encoding import encode_audio
+    encoded = encode_audio(pcm16_bytes(audio), csm_agent.sample_rate, 'wav')
+    if tts_cache.put(cache_key, encoded.data, persist=persist) is None:
+        return None, None, ({'error': 'Failed to store generated audio'}, 500)
+    return encoded.data, {'cache_key': cache_key, 'cached': False, 'encode_ms': encoded.encode_ms}, None
+
+def synthesize_csm_speech(text, speaker_id=0, max_duration=10000, temperature=0.9, wait_ready=False):
+    """Cached CSM synthesis shared by the synchronous route and background jobs; returns (payload, status)"""
+    from tts_cache import get_tts_cache, wav_duration_ms
+    
+    wav_data, info, error = _csm_wav(text, speaker_id, max_duration, temperature, wait_ready, persist=True)
+    if error:
+        return error
+    
+    return {
+        'status': 'success',
+        'audio_url': get_tts_cache().url_for(info['cache_key']),
+        'text': text,
+        'speaker_id': speaker_id,
+        'duration_ms': wav_duration_ms(wav_data),
+        'model': 'CSM-1B',
+        'cached': info['cached'],
+        'audio_bytes': len(wav_data),
+        'encode_ms': round(info['encode_ms'], 2)
+    }, 200
+
+def synthesize_csm_audio(text, speaker_id=0, max_duration=10000, temperature=0.9, audio_format='wav'):
+    """
+    CSM synthesis encoded in memory for the response body
+    
+    Returns (EncodedAudio, response_headers, None) or (None, None, (error_payload, status)).
+    New audio is kept in the memory cache only; nothing is written to disk.
+    """
+    import io
+    import wave
+    from audio_encoding import EncodedAudio, encode_audio
+    
+    wav_data, info, error = _csm_wav(text, speaker_id, max_duration, temperature, False, persist=False)
+    if error:
+        return None, None, error
+    
+    with wave.open(io.BytesIO(wav_data), 'rb') as wav_file:
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.getnframes()
+        pcm = wav_file.readframes(frames) if audio_format != 'wav' else None
+    
+    if audio_format == 'wav':
+        encoded = EncodedAudio(data=wav_data, format='wav', mimetype='audio/wav', encode_ms=info['encode_ms'])
+    else:
+        encoded = encode_audio(pcm, sample_rate, audio_format)
+    
+    return encoded, {
+        'X-Audio-Bytes': str(len(encoded.data)),
+        'X-Encode-Ms': f"{encoded.encode_ms:.2f}",
+        'X-Sample-Rate': str(sample_rate),
+        'X-Duration-Ms': f"{frames / sample_rate * 1000:.0f}",
+        'X-Cached': 'true' if info['cached'] else 'false',
+        'Cache-Control': 'no-cache'
+    }, None
+
+def _csm_speech_job(job, **params):
+    job.set_progress(0.1, 'generating')
+    payload, status = synthesize_csm_speech(wait_ready=True, **params)
+    if status != 200:
+        raise RuntimeError(payload.get('details') or payload['error'])
+    return payload
+
 @app.route('/api/csm-speech', methods=['POST'])
 def csm_speech_generation():
     """CSM (Conversational Speech Model) endpoint for ultra-realistic speech"""
     try:
-        from csm_integration import get_csm_agent
+        data = request.get_json()
+        if not data or 'text' not in data:
+            return jsonify({'error': 'No text provided'}), 400
+        
+        text = data['text'].strip()
+        if not text:
+            return jsonify({'error': 'Empty text'}), 400
+        
+        # Generate parameters
+        params = {
+            'text': text,
+            'speaker_id': data.get('speaker_id', 0),
+            'max_duration': data.get('max_duration_ms', 10000),
+            'temperature': data.get('temperature', 0.9)
+        }
+        
+        if data.get('async'):
+            from job_queue import get_job_manager, QueueFullError
+            try:
+                job = get_job_manager().submit('csm-speech', _csm_speech_job, **params)
+            except QueueFullError as e:
+                return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+            return jsonify({
+                'status': 'accepted',
+                'job_id': job.id,
+                'status_url': f'/api/jobs/{job.id}'
+            }), 202
+        
+        # inline: the encoded audio is the response body, with size and encode time in headers
+        if data.get('inline'):
+            from audio_encoding import ENCODERS, AudioEncodingError
+            audio_format = data.get('format', 'wav')
+            if audio_format not in ENCODERS:
+                return jsonify({'error': f'Unsupported format: {audio_format}'}), 400
+            try:
+                encoded, headers, error = synthesize_csm_audio(audio_format=audio_format, **params)
+            except AudioEncodingError as e:
+                return jsonify({'error': f'Audio encoding failed: {str(e)}'}), 500
+            if not error:
+                return Response(encoded.data, mimetype=encoded.mimetype, headers=headers)
+            payload, status = error
+        else:
+            payload, status = synthesize_csm_speech(**params)
+        
+        if status == 503:
+            return jsonify(payload), status, {'Retry-After': str(payload['retry_after'])}
+        return jsonify(payload), status
+        
+    except Exception as e:
+        logging.error(f"CSM speech generation error: {str(e)}")
+        return jsonify({'error': f'CSM error: {str(e)}'}), 500
+
+@app.route('/api/csm-speech-stream', methods=['POST'])
+def csm_speech_stream():
+    """Stream CSM speech as chunked WAV (or raw PCM) while it is being generated"""
+    try:
+        from csm_integration import pcm16_bytes, streaming_wav_header
         
         data = request.get_json()
         if not data or 'text' not in data:
@@ -497,8 +975,16 @@ def csm_speech_generation():
         if not text:
             return jsonify({'error': 'Empty text'}), 400
         
-        # Get CSM agent
-        csm_agent = get_csm_agent()
+        audio_format = data.get('format', 'wav')
+        if audio_format not in ('wav', 'pcm'):
+            return jsonify({'error': f'Unsupported format: {audio_format}'}), 400
+        
+        warming_up = _csm_warming_up()
+        if warming_up:
+            payload, status = warming_up
+            return jsonify(payload), status, {'Retry-After': str(payload['retry_after'])}
+        
+        csm_agent = services.get('csm')
         
         if not csm_agent.is_available():
             return jsonify({
@@ -506,63 +992,90 @@ def csm_speech_generation():
                 'details': csm_agent.error
             }), 500
         
-        # Generate parameters
-        speaker_id = data.get('speaker_id', 0)
-        max_duration = data.get('max_duration_ms', 10000)
-        temperature = data.get('temperature', 0.9)
-        
-        # Generate speech
-        audio = csm_agent.generate_speech(
+        chunks = csm_agent.generate_speech_stream(
             text=text,
-            speaker_id=speaker_id,
-            max_duration_ms=max_duration,
-            temperature=temperature
+            speaker_id=data.get('speaker_id', 0),
+            max_duration_ms=data.get('max_duration_ms', 10000),
+            temperature=data.get('temperature', 0.9)
         )
         
-        if audio is not None:
-            # Save audio file
-            audio_filename = f"csm_output_{int(time.time())}.wav"
-            audio_path = os.path.join('static', 'audio', audio_filename)
-            
-            # Ensure audio directory exists
-            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-            
-            if csm_agent.save_audio(audio, audio_path):
-                return jsonify({
-                    'status': 'success',
-                    'audio_url': f'/static/audio/{audio_filename}',
-                    'text': text,
-                    'speaker_id': speaker_id,
-                    'duration_ms': len(audio) / csm_agent.sample_rate * 1000,
-                    'model': 'CSM-1B'
-                })
-            else:
-                return jsonify({'error': 'Failed to save audio'}), 500
-        else:
+        # Pull the first chunk before committing to a 200 so failures still get a JSON error
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
             return jsonify({'error': 'Speech generation failed'}), 500
         
+        sample_rate = csm_agent.sample_rate
+        
+        def generate():
+            if audio_format == 'wav':
+                yield streaming_wav_header(sample_rate)
+            yield pcm16_bytes(first_chunk)
+            for chunk in chunks:
+                yield pcm16_bytes(chunk)
+        
+        mimetype = 'audio/wav' if audio_format == 'wav' else f'audio/L16;rate={sample_rate};channels=1'
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={
+                'X-Sample-Rate': str(sample_rate),
+                'Cache-Control': 'no-cache'
+            }
+        )
+        
     except Exception as e:
-        logging.error(f"CSM speech generation error: {str(e)}")
+        logging.error(f"CSM speech streaming error: {str(e)}")
         return jsonify({'error': f'CSM error: {str(e)}'}), 500
 
 @app.route('/api/csm-status', methods=['GET'])
 def csm_status():
     """Get CSM system status"""
     try:
-        from csm_integration import get_csm_agent
-        
-        csm_agent = get_csm_agent()
-        status = csm_agent.get_status()
+        from tts_cache import get_tts_cache
+        from csm_warmup import get_csm_warmup
+        
+        # Never block on a model that is still loading; report the warm-up instead.
+        # The scheduler is built on top of the agent, so it is only read if it already exists
+        warmup = get_csm_warmup()
+        if warmup.is_pending():
+            status = warmup.get_status()
+            scheduler = services.peek('csm_scheduler')
+        else:
+            status = services.get('csm').get_status()
+            scheduler = services.get('csm_scheduler')
         
         return jsonify({
             'status': 'success',
-            'csm_status': status
+            'csm_status': status,
+            'warmup': warmup.get_status(),
+            'batching': scheduler.get_stats() if scheduler is not None else None,
+            'cache': get_tts_cache().get_stats(),
+            'services': services.get_status()
         })
         
     except Exception as e:
         logging.error(f"CSM status check error: {str(e)}")
         return jsonify({'error': f'Status check failed: {str(e)}'}), 500
 
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: 200 once the CSM model is loaded and warmed, 503 otherwise"""
+    from csm_warmup import get_csm_warmup
+    
+    warmup = get_csm_warmup()
+    status = warmup.get_status()
+    if warmup.is_ready() or status['state'] == 'idle':
+        # idle: warm-up disabled, CSM loads on first use
+        return jsonify(status)
+    if warmup.is_pending():
+        return jsonify(status), 503, {'Retry-After': str(warmup.retry_after)}
+    return jsonify(status), 503
+
 @app.route('/api/livekit-voice', methods=['POST'])
 def livekit_voice_interaction():
     """LiveKit voice AI agent endpoint for real-time conversation"""
@@ -0,0 +1,101 @@
+"""
+Lazy service registry
+Heavy subsystems (model services, CSM, face swap) are registered by name and only
+imported and constructed the first time something asks for them, so the web
+process starts without paying for torch, model weights or HTTP clients
+"""
+import os
+import time
+import logging
+import importlib
+import threading
+from typing import Callable, Dict, Iterable, Union
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """Name -> factory mapping whose instances are created on first use"""
+
+    def __init__(self):
+        # One LazySingleton per service, so a slow load (CSM weights) never blocks a fast one
+        self._services: Dict[str, LazySingleton] = {}
+
+    def register(self, name: str, factory: Union[str, Callable]):
+        """
+        Register a service
+
+        Args:
+            name: Service name used with get()
+            factory: Zero-argument callable, or "module:attribute" naming one so
+                that even the module import is deferred
+        """
+        self._services[name] = LazySingleton(lambda: self._resolve(factory)(), name)
+
+    def _resolve(self, factory: Union[str, Callable]) -> Callable:
+        if callable(factory):
+            return factory
+        module_name, _, attribute = factory.partition(':')
+        return getattr(importlib.import_module(module_name), attribute)
+
+    def get(self, name: str):
+        """Return the service instance, importing and constructing it if needed"""
+        if name not in self._services:
+            raise KeyError(f"Unknown service: {name}")
+        return self._services[name].get()
+
+    def peek(self, name: str):
+        """The service instance if it has already been created, else None; never creates it"""
+        if name not in self._services:
+            raise KeyError(f"Unknown service: {name}")
+        return self._services[name].peek()
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._services and self._services[name].is_loaded()
+
+    def prewarm(self, names: Iterable[str], delay: float = 0.0) -> threading.Thread:
+        """Load services in a background thread after an optional delay"""
+        names = [name for name in names if name]
+
+        def run():
+            if delay:
+                time.sleep(delay)
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logger.error(f"Pre-warming service '{name}' failed: {e}")
+
+        thread = threading.Thread(target=run, name='service-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+    def get_status(self) -> dict:
+        """Which services are registered and loaded, with their load times"""
+        return {
+            name: {
+                'loaded': service.is_loaded(),
+                'load_seconds': round(service.load_seconds, 3) if service.load_seconds is not None else None
+            }
+            for name, service in self._services.items()
+        }
+
+
+services = ServiceRegistry()
+services.register('csm', 'csm_integration:get_csm_agent')
+services.register('csm_scheduler', 'csm_batching:get_csm_scheduler')
+services.register('face_swap', 'face_swap_service:get_face_swap_service')
+
+
+def prewarm_from_env():
+    """
+    Pre-warm the services listed in SERVICE_PREWARM (comma separated)
+
+    Loading starts SERVICE_PREWARM_DELAY seconds (default 2) after boot so the
+    server is already accepting requests while it runs.
+    """
+    names = [name.strip() for name in os.environ.get('SERVICE_PREWARM', 'model').split(',')]
+    if any(names):
+        services.prewarm(names, delay=float(os.environ.get('SERVICE_PREWARM_DELAY', 2)))
@@ -0,0 +1,59 @@
+"""
+History cursors bound the NDJSON stream the same way they bound JSON pages
+"""
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='chat-test-'), 'test.db'))
+os.environ.setdefault('SERVICE_PREWARM', '')
+os.environ.setdefault('CSM_WARMUP', '0')
+os.environ.setdefault('CHAT_PURGE_POLL_SECONDS', '3600')
+
+import pytest
+
+from app import app, db
+from models import ChatMessage
+
+MESSAGES = 10
+
+
+@pytest.fixture
+def client():
+    session_id = 'history-cursor'
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        ChatMessage.query.filter_by(session_id=session_id).delete()
+        db.session.add_all([ChatMessage(session_id=session_id, role='user', content=f'message {i}',
+                                        timestamp=start + timedelta(seconds=i)) for i in range(MESSAGES)])
+        db.session.commit()
+    # Other test modules may have imported the app first, without SESSION_SECRET
+    app.secret_key = app.secret_key or 'test'
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['session_id'] = session_id
+    return client
+
+
+def _ids(client, **params):
+    """Message ids of the JSON page and of the NDJSON stream for the same query"""
+    page = client.get('/api/history', query_string={**params, 'limit': MESSAGES})
+    stream = client.get('/api/history', query_string={**params, 'format': 'ndjson'})
+    assert page.status_code == stream.status_code == 200
+    streamed = [json.loads(line)['id'] for line in stream.get_data(as_text=True).splitlines()]
+    return [message['id'] for message in page.get_json()['messages']], streamed
+
+
+def test_ndjson_honours_cursors(client):
+    everything, streamed = _ids(client)
+    assert streamed == everything and len(everything) == MESSAGES
+
+    cursor = everything[4]
+    assert _ids(client, before=cursor) == (everything[:4], everything[:4])
+    assert _ids(client, after=cursor) == (everything[5:], everything[5:])
+
+
+def test_ndjson_rejects_unknown_cursor(client):
+    response = client.get('/api/history', query_string={'before': 10**9, 'format': 'ndjson'})
+    assert response.status_code == 400
@@ -0,0 +1,86 @@
+"""
+Chat writes keep flowing while a large cleared session is purged
+"""
+import os
+import tempfile
+import threading
+import time
+
+# Configure the app before it is imported: a throwaway SQLite database, no
+# background model loading, and a global purger that stays out of the way
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='chat-test-'), 'test.db'))
+os.environ.setdefault('SERVICE_PREWARM', '')
+os.environ.setdefault('CSM_WARMUP', '0')
+os.environ.setdefault('CHAT_PURGE_POLL_SECONDS', '3600')
+
+from sqlalchemy import func, insert, select
+
+from app import app, db
+from models import ChatMessage, ClearedSession
+from chat_maintenance import SessionPurger
+from chat_persistence import ChatTurnWriter
+
+PURGE_ROWS = 100_000
+# Slowest single chat write allowed while the purge runs; one DELETE of all
+# 100k rows holds SQLite's write lock for several hundred milliseconds
+MAX_WRITE_MS = float(os.environ.get('CHAT_PURGE_MAX_WRITE_MS', 200))
+# Gap between a live session's turns, so the writer behaves like chat traffic
+WRITE_INTERVAL_MS = 5
+
+
+def _populate(session_id):
+    with app.app_context():
+        for start in range(0, PURGE_ROWS, 10_000):
+            db.session.execute(insert(ChatMessage), [
+                {'session_id': session_id, 'role': 'user', 'content': f'message {i}'}
+                for i in range(start, min(PURGE_ROWS, start + 10_000))
+            ])
+        db.session.add(ClearedSession(session_id=session_id))
+        db.session.commit()
+
+
+def _count(session_id):
+    with app.app_context():
+        return db.session.execute(
+            select(func.count()).select_from(ChatMessage).where(ChatMessage.session_id == session_id)
+        ).scalar()
+
+
+def test_chat_writes_not_blocked_by_large_purge():
+    _populate('purge-large')
+    writer = ChatTurnWriter(app, mode='transaction')
+    latencies = []
+    errors = []
+    done = threading.Event()
+
+    def write_turns():
+        try:
+            with app.app_context():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    writer.write_turn('purge-live', 'still chatting', 'still answering')
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    time.sleep(WRITE_INTERVAL_MS / 1000)
+        except Exception as e:
+            errors.append(e)
+
+    writer_thread = threading.Thread(target=write_turns)
+    writer_thread.start()
+    try:
+        with app.app_context():
+            purged = SessionPurger().purge_pending()
+    finally:
+        done.set()
+        writer_thread.join()
+
+    assert not errors
+    assert purged == PURGE_ROWS
+    assert _count('purge-large') == 0
+    with app.app_context():
+        assert db.session.get(ClearedSession, 'purge-large') is None
+
+    # Every write landed, none of them waited long behind a purge batch
+    assert latencies
+    assert _count('purge-live') == 2 * len(latencies)
+    worst = max(latencies)
+    assert worst < MAX_WRITE_MS, f"slowest chat write took {worst:.0f} ms during the purge (limit {MAX_WRITE_MS:.0f} ms)"
@@ -0,0 +1,58 @@
+"""
+A backlog of speech requests is batched by similar text length without starving the oldest request
+"""
+import threading
+
+from csm_batching import CSMBatchScheduler
+
+
+class _RecordingAgent:
+    """Stands in for CSMVoiceAgent; holds the first batch until released so a backlog builds up"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_speech_batch(self, requests):
+        if not self.batches:
+            self.started.set()
+            self.release.wait(timeout=5)
+        texts = [request['text'] for request in requests]
+        self.batches.append(texts)
+        return [f"audio:{text}" for text in texts]
+
+
+def test_backlog_is_batched_by_length_oldest_first():
+    agent = _RecordingAgent()
+    scheduler = CSMBatchScheduler(agent, max_batch_size=4, max_wait_ms=0)
+
+    first = scheduler.submit('x')
+    assert agent.started.wait(timeout=5)
+    # Interleave short and long prompts while the first batch is running
+    texts = ['s' * n if i % 2 else 'L' * (100 + n) for i, n in enumerate(range(1, 9))]
+    futures = [scheduler.submit(text) for text in texts]
+    agent.release.set()
+
+    assert first.result(timeout=5) == 'audio:x'
+    assert [future.result(timeout=5) for future in futures] == [f"audio:{text}" for text in texts]
+
+    backlog = agent.batches[1:]
+    assert sorted(len(batch) for batch in backlog) == [4, 4]
+    for batch in backlog:
+        assert len({text[0] for text in batch}) == 1, f"mixed short and long prompts in {batch}"
+    # Each round serves the oldest request still waiting
+    assert texts[0] in backlog[0]
+    assert scheduler.get_stats()['queued'] == 0
+
+
+def test_batch_within_size_keeps_arrival_order():
+    agent = _RecordingAgent()
+    agent.release.set()
+    scheduler = CSMBatchScheduler(agent, max_batch_size=8, max_wait_ms=50)
+
+    texts = ['long prompt text', 'a', 'medium']
+    futures = [scheduler.submit(text) for text in texts]
+
+    assert [future.result(timeout=5) for future in futures] == [f"audio:{text}" for text in texts]
+    assert agent.batches == [texts]
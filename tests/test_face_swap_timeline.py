@@ -0,0 +1,137 @@
+"""
+Face-swap timelines: malformed entries are a 400 before any frame is rendered,
+and uploaded avatars belong to the client that names them
+"""
+import base64
+import io
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='face-test-'), 'test.db'))
+os.environ.setdefault('SERVICE_PREWARM', '')
+os.environ.setdefault('CSM_WARMUP', '0')
+
+import pytest
+from PIL import Image
+
+from app import app
+from face_backends import LocalWarpFaceBackend
+from face_swap_service import FaceSwapService
+from service_registry import services
+from viseme_atlas import VisemeAtlasStore
+
+
+def _avatar_b64(color=(224, 180, 150)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 320), color).save(buffer, format='JPEG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _service(avatar_dir):
+    service = FaceSwapService(backend=LocalWarpFaceBackend(),
+                              atlas=VisemeAtlasStore(root=tempfile.mkdtemp(prefix='atlas-test-')))
+    service.avatar_dir = avatar_dir
+    service.initialize()
+    return service
+
+
+@pytest.fixture
+def avatar_dir():
+    return tempfile.mkdtemp(prefix='avatars-test-')
+
+
+@pytest.fixture
+def service(avatar_dir):
+    service = _service(avatar_dir)
+    services.register('face_swap', lambda: service)
+    yield service
+    services.register('face_swap', 'face_swap_service:get_face_swap_service')
+
+
+@pytest.fixture
+def client(service):
+    return app.test_client()
+
+
+@pytest.mark.parametrize('timeline', [
+    [],
+    'a',
+    [5],
+    [None],
+    [{'phoneme': 'a', 'intensity': 'x'}],
+    [{'phoneme': 'a', 'intensity': 1.5}],
+    [{'phoneme': 'a', 'intensity': True}],
+    [{'phoneme': 7}],
+    [{'phoneme': 'a', 'mouth': 'open'}],
+    ['a', {'phoneme': 'o'}, 3],
+])
+@pytest.mark.parametrize('response_format, stream', [('json', False), ('json', True), ('multipart', False)])
+def test_malformed_timeline_is_rejected(client, timeline, response_format, stream):
+    response = client.post('/api/face-swap', json={'timeline': timeline, 'avatar': _avatar_b64(),
+                                                   'format': response_format, 'stream': stream})
+
+    assert response.status_code == 400
+    assert 'timeline' in response.get_json()['error']
+
+
+def test_well_formed_timeline_renders(client):
+    timeline = ['a', {'phoneme': 'm'}, {'phoneme': 'o', 'emotion': 'happy', 'intensity': 1}, 'zz']
+    response = client.post('/api/face-swap', json={'timeline': timeline, 'avatar': _avatar_b64()})
+
+    assert response.status_code == 200
+    frames = response.get_json()['frames']
+    assert [frame['index'] for frame in frames] == [0, 1, 2, 3]
+    assert all(frame['image'] for frame in frames)
+
+
+def _upload(client, color):
+    response = client.post('/api/face-swap/avatar', json={'image': _avatar_b64(color)})
+    assert response.status_code == 200
+    return response.get_json()['avatar_id']
+
+
+def _render(client, avatar_id):
+    response = client.post('/api/face-swap', json={'timeline': ['a', 'o'], 'avatar_id': avatar_id})
+    assert response.status_code == 200
+    return [frame['image'] for frame in response.get_json()['frames']]
+
+
+def test_avatar_upload_does_not_change_other_clients_face(client, service):
+    first = _upload(client, (224, 180, 150))
+    first_frames = _render(client, first)
+    second = _upload(client, (90, 60, 40))
+
+    assert first != second
+    assert service.source is None
+    assert _render(client, first) == first_frames
+    assert _render(client, second) != first_frames
+
+
+def test_timeline_without_avatar_is_rejected(client):
+    response = client.post('/api/face-swap', json={'timeline': ['a']})
+    assert response.status_code == 400
+
+
+def test_unknown_avatar_id_is_not_found(client):
+    response = client.post('/api/face-swap', json={'timeline': ['a'], 'avatar_id': '0' * 64})
+    assert response.status_code == 404
+    response = client.post('/api/face-swap', json={'timeline': ['a'], 'avatar_id': '../etc/passwd'})
+    assert response.status_code == 404
+    response = client.post('/api/face-swap', json={'timeline': ['a'], 'avatar_id': 5})
+    assert response.status_code == 404
+
+
+def test_avatar_that_is_not_an_image_is_rejected(client):
+    for avatar in (5, 'not base64!', base64.b64encode(b'plain text').decode('ascii')):
+        response = client.post('/api/face-swap', json={'timeline': ['a'], 'avatar': avatar})
+        assert response.status_code == 400
+
+
+def test_avatar_id_resolves_in_another_worker(client, avatar_dir):
+    avatar_id = _upload(client, (224, 180, 150))
+    frames = _render(client, avatar_id)
+
+    # A second service instance shares only the avatar directory, as another worker process would
+    other = _service(avatar_dir)
+    services.register('face_swap', lambda: other)
+    assert _render(client, avatar_id) == frames
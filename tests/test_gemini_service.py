@@ -0,0 +1,28 @@
+"""
+Follow-up messages with no keyword of their own keep the topic of the last user turn
+"""
+from gemini_service import GeminiService
+
+HISTORY = [
+    {'role': 'user', 'content': 'How do I deploy this?'},
+    {'role': 'assistant', 'content': 'Hello! Which platform are you deploying to?'},
+]
+
+
+def test_follow_up_uses_last_user_turn():
+    service = GeminiService()
+
+    assert service.generate_response('tell me more', HISTORY) == service.intents.respond('deploy')
+
+
+def test_own_intent_wins_over_history():
+    service = GeminiService()
+
+    assert service.generate_response('hello', HISTORY) == service.intents.respond('hello')
+
+
+def test_no_intent_anywhere_falls_back():
+    service = GeminiService()
+
+    assert service.generate_response('tell me more', []) == service.intents.respond('tell me more')
+    assert service.generate_response('tell me more', HISTORY[1:]) == service.intents.respond('tell me more')
@@ -0,0 +1,90 @@
+"""
+Simultaneous first requests for a lazily created service build it exactly once
+"""
+import threading
+import time
+
+import pytest
+
+from lazy_singleton import LazySingleton
+from service_registry import ServiceRegistry
+
+CLIENTS = 32
+# Long enough that every client reaches get() while the first build is still running
+LOAD_SECONDS = 0.2
+
+
+class _Model:
+    """Stands in for a service whose construction is slow (model weights)"""
+
+
+def _counting_factory(loads):
+    def load():
+        loads.append(threading.get_ident())
+        time.sleep(LOAD_SECONDS)
+        return _Model()
+    return load
+
+
+def _concurrent_first_gets(getter):
+    """Call getter from CLIENTS threads released together; returns every result"""
+    barrier = threading.Barrier(CLIENTS)
+    results = [None] * CLIENTS
+    errors = []
+
+    def client(index):
+        barrier.wait()
+        try:
+            results[index] = getter()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+
+def test_lazy_singleton_loads_once_under_concurrent_first_gets():
+    loads = []
+    singleton = LazySingleton(_counting_factory(loads), 'model')
+
+    results = _concurrent_first_gets(singleton.get)
+
+    assert len(loads) == 1
+    assert singleton.load_count == 1
+    assert all(result is results[0] for result in results)
+    assert singleton.peek() is results[0]
+
+
+def test_service_registry_loads_once_under_concurrent_first_gets():
+    loads = []
+    registry = ServiceRegistry()
+    registry.register('model', _counting_factory(loads))
+
+    results = _concurrent_first_gets(lambda: registry.get('model'))
+
+    assert len(loads) == 1
+    assert all(result is results[0] for result in results)
+    assert registry.is_loaded('model')
+
+
+def test_failed_load_stores_nothing_and_is_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('weights unavailable')
+        return _Model()
+
+    singleton = LazySingleton(flaky, 'model')
+    with pytest.raises(RuntimeError):
+        singleton.get()
+    assert not singleton.is_loaded()
+
+    assert isinstance(singleton.get(), _Model)
+    assert len(attempts) == 2
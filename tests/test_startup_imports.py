@@ -0,0 +1,34 @@
+"""
+Importing the app must not load the heavy model stacks; they come in through service_registry on first use
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('torch', 'torchaudio', 'gradio', 'transformers')
+
+
+def _imported_modules():
+    """Every module a fresh `import app` loads, from -X importtime"""
+    env = dict(os.environ, SERVICE_PREWARM='', CSM_WARMUP='0',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='startup-test-'), 'test.db'))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                          capture_output=True, text=True, env=env, cwd=ROOT, timeout=120)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+
+    # stderr lines: "import time: <self us> | <cumulative us> | <indented module>"
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            modules.add(line.rsplit('|', 1)[1].strip())
+    return modules
+
+
+def test_import_app_loads_no_heavy_modules():
+    modules = _imported_modules()
+
+    assert 'app' in modules
+    loaded = sorted(module for module in modules if module.split('.')[0] in HEAVY_MODULES)
+    assert not loaded, f"startup imported {loaded}; load these through service_registry instead"
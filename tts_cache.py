@@ -0,0 +1,220 @@
+"""
+Content-addressed cache for synthesized speech
+Two tiers: an in-memory LRU of WAV bytes and a size-bounded directory of WAV files under static/audio
+"""
+import io
+import os
+import json
+import wave
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join('static', 'audio', 'cache')
+CACHE_URL_PREFIX = '/static/audio/cache'
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of the text used for keying (NFC, collapsed whitespace)"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def make_cache_key(
+    text: str,
+    speaker_id: int,
+    temperature: float,
+    max_duration_ms: float,
+    context_hashes: Iterable[str] = ()
+) -> str:
+    """Hash every input that influences the generated audio"""
+    payload = json.dumps({
+        'text': normalize_text(text),
+        'speaker_id': int(speaker_id),
+        'temperature': round(float(temperature), 4),
+        'max_duration_ms': round(float(max_duration_ms), 1),
+        'context': list(context_hashes)
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def wav_duration_ms(wav_data: bytes) -> float:
+    """Duration of an in-memory WAV file in milliseconds"""
+    with wave.open(io.BytesIO(wav_data), 'rb') as wav_file:
+        return wav_file.getnframes() / wav_file.getframerate() * 1000
+
+
+class TTSAudioCache:
+    """Two-tier LRU cache of encoded WAV audio keyed by make_cache_key"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, memory_bytes: int = None, disk_bytes: int = None):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes if memory_bytes is not None else \
+            int(os.environ.get('TTS_CACHE_MEMORY_MB', 64)) * 1024 * 1024
+        self.disk_bytes = disk_bytes if disk_bytes is not None else \
+            int(os.environ.get('TTS_CACHE_DISK_MB', 512)) * 1024 * 1024
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_size = sum(size for _, _, size in self._disk_entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def url_for(self, key: str) -> str:
+        """Public URL of a cached entry"""
+        return f"{CACHE_URL_PREFIX}/{key}.wav"
+
+    def _disk_entries(self):
+        """(mtime, path, size) for every cached file"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.wav'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _remember(self, key: str, wav_data: bytes):
+        """Insert into the memory tier, evicting least recently used entries (lock held)"""
+        if len(wav_data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = wav_data
+        self._memory_size += len(wav_data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key: str, persist: bool = False) -> Optional[bytes]:
+        """
+        Return cached WAV bytes, or None on a miss
+
+        With persist=True the entry is guaranteed to be on disk as well, so
+        url_for(key) resolves: memory-only entries (put with persist=False, or
+        whose file was evicted or removed by another process) are written back.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                wav_data = self._memory[key]
+                if persist and not os.path.exists(self._path(key)) and not self._write_disk(key, wav_data):
+                    self.misses += 1
+                    return None
+                self.memory_hits += 1
+                return wav_data
+
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    wav_data = f.read()
+                os.utime(path)  # mtime doubles as the disk tier's LRU clock
+            except OSError:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._remember(key, wav_data)
+            return wav_data
+
+    def put(self, key: str, wav_data: bytes, persist: bool = True) -> Optional[str]:
+        """
+        Store WAV bytes in both tiers and return the public URL
+
+        With persist=False only the memory tier is filled and nothing is
+        written to disk, so the returned URL does not resolve. Returns None if
+        the file could not be written.
+        """
+        with self._lock:
+            self._remember(key, wav_data)
+            if not persist:
+                return self.url_for(key)
+            if not self._write_disk(key, wav_data):
+                return None
+
+        return self.url_for(key)
+
+    def _write_disk(self, key: str, wav_data: bytes) -> bool:
+        """Write one entry to the disk tier, evicting old files if over budget (lock held)"""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(wav_data)
+            os.replace(temp_path, path)  # atomic, so readers never see partial files
+            self._disk_size += len(wav_data) - previous_size
+        except OSError as e:
+            logger.error(f"Failed to write TTS cache entry {key}: {e}")
+            return False
+
+        if self._disk_size > self.disk_bytes:
+            self._evict_disk(keep=key)
+        return True
+
+    def _evict_disk(self, keep: str = None):
+        """Delete the least recently used files until the disk tier fits (lock held)"""
+        keep_path = self._path(keep) if keep else None
+        entries = sorted(self._disk_entries())
+        self._disk_size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._disk_size <= self.disk_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                self._disk_size -= size
+                self.evictions += 1
+            except OSError:
+                continue
+            # An evicted file's URL no longer resolves, so its memory copy goes too
+            evicted = self._memory.pop(os.path.basename(path)[:-len('.wav')], None)
+            if evicted is not None:
+                self._memory_size -= len(evicted)
+
+    def get_stats(self) -> dict:
+        """Get cache hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'disk_bytes': self._disk_size
+            }
+
+# Global cache instance, created on first use
+_tts_cache = LazySingleton(TTSAudioCache, 'tts_cache')
+
+def get_tts_cache():
+    """Get or create the global TTS audio cache"""
+    return _tts_cache.get()
@@ -0,0 +1,249 @@
+"""
+Viseme frame atlas for avatar lip animation
+Every (phoneme x emotion x intensity bucket) face of an avatar is rendered
+once, in parallel, and stored as a single sprite file plus an offset index
+under a directory named by the source face hash. Lookups are dictionary hits.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+ATLAS_VERSION = 1
+ATLAS_DIR = os.environ.get('VISEME_ATLAS_DIR', os.path.join('.cache', 'viseme_atlas'))
+
+# Phonemes the avatar animates; 'rest' is the face used for anything else
+PHONEMES = ('a', 'e', 'i', 'o', 'u', 'm', 'b', 'p', 'f', 's', 'rest')
+EMOTIONS = ('neutral', 'happy', 'surprised', 'focused', 'friendly')
+
+
+def _env_buckets() -> tuple:
+    return tuple(float(value) for value in os.environ.get('VISEME_INTENSITY_BUCKETS', '0.3,0.5,0.7').split(','))
+
+
+def intensity_bucket(intensity: float, buckets: Iterable[float]) -> float:
+    """Nearest configured intensity level"""
+    return min(buckets, key=lambda bucket: abs(bucket - intensity))
+
+
+def frame_key(phoneme: str, emotion: str, bucket: float) -> str:
+    return f"{phoneme}/{emotion}/{bucket:.2f}"
+
+
+class VisemeAtlasStore:
+    """
+    On-disk atlases keyed by source face hash, with the recently used ones in memory
+
+    Each atlas directory holds frames.bin (every frame's image bytes back to
+    back) and index.json (frame key -> [offset, length]). Directories are
+    touched when used; the least recently used beyond max_avatars, and any
+    unused for max_age_days, are deleted.
+    """
+
+    def __init__(
+        self,
+        root: str = ATLAS_DIR,
+        emotions: Iterable[str] = EMOTIONS,
+        buckets: Iterable[float] = None,
+        workers: int = None,
+        max_avatars: int = None,
+        max_age_days: float = None,
+        memory_avatars: int = None
+    ):
+        self.root = root
+        self.emotions = tuple(emotions)
+        self.buckets = tuple(buckets) if buckets is not None else _env_buckets()
+        self.workers = workers or int(os.environ.get('VISEME_ATLAS_WORKERS', 8))
+        self.max_avatars = max_avatars or int(os.environ.get('VISEME_ATLAS_MAX_AVATARS', 20))
+        self.max_age_days = max_age_days or float(os.environ.get('VISEME_ATLAS_MAX_AGE_DAYS', 30))
+        self.memory_avatars = memory_avatars or int(os.environ.get('VISEME_ATLAS_MEMORY_AVATARS', 4))
+
+        # face hash -> {frame key: encoded image bytes}
+        self._atlases = OrderedDict()
+        self._building: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='viseme-atlas')
+
+        self.hits = 0
+        self.misses = 0
+        self.frames_rendered = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def frame_keys(self):
+        for phoneme in PHONEMES:
+            for emotion in self.emotions:
+                for bucket in self.buckets:
+                    yield phoneme, emotion, bucket
+
+    def _dir(self, face_hash: str) -> str:
+        return os.path.join(self.root, face_hash)
+
+    def _remember(self, face_hash: str, frames: Dict[str, bytes]):
+        """Make an atlas the most recently used in memory (lock held)"""
+        self._atlases[face_hash] = frames
+        self._atlases.move_to_end(face_hash)
+        while len(self._atlases) > self.memory_avatars:
+            self._atlases.popitem(last=False)
+
+    def _load(self, face_hash: str) -> Dict[str, bytes]:
+        """Read an atlas from disk; empty if missing, outdated or unreadable"""
+        directory = self._dir(face_hash)
+        try:
+            with open(os.path.join(directory, 'index.json'), 'r') as f:
+                index = json.load(f)
+            if index.get('version') != ATLAS_VERSION:
+                return {}
+            with open(os.path.join(directory, 'frames.bin'), 'rb') as f:
+                blob = f.read()
+            os.utime(directory)  # mtime doubles as the eviction clock
+        except (OSError, ValueError):
+            return {}
+        return {key: blob[offset:offset + length] for key, (offset, length) in index['frames'].items()}
+
+    def _save(self, face_hash: str, frames: Dict[str, bytes]):
+        """Write frames.bin and index.json, then swap the directory in atomically"""
+        directory = self._dir(face_hash)
+        staging = tempfile.mkdtemp(prefix=f'.{face_hash}.', dir=self.root)
+        index = {'version': ATLAS_VERSION, 'frames': {}}
+        offset = 0
+        with open(os.path.join(staging, 'frames.bin'), 'wb') as f:
+            for key, data in frames.items():
+                f.write(data)
+                index['frames'][key] = [offset, len(data)]
+                offset += len(data)
+        with open(os.path.join(staging, 'index.json'), 'w') as f:
+            json.dump(index, f)
+
+        previous = f"{directory}.old.{os.getpid()}.{threading.get_ident()}"
+        if os.path.isdir(directory):
+            os.replace(directory, previous)
+        os.replace(staging, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def get(self, face_hash: str, phoneme: str, emotion: str, intensity: float) -> Optional[bytes]:
+        """Encoded image bytes from the atlas, or None if the frame has not been rendered"""
+        key = frame_key(phoneme, emotion, intensity_bucket(intensity, self.buckets))
+        with self._lock:
+            frames = self._atlases.get(face_hash)
+            if frames is not None:
+                self._atlases.move_to_end(face_hash)
+                frame = frames.get(key)
+                if frame is not None:
+                    self.hits += 1
+                    return frame
+                self.misses += 1
+                return None
+
+        frames = self._load(face_hash)
+        with self._lock:
+            if face_hash not in self._atlases:
+                self._remember(face_hash, frames)
+            frame = self._atlases[face_hash].get(key)
+            if frame is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return frame
+
+    def build(self, face_hash: str, render: Callable[[str, str, float], Optional[bytes]]) -> Future:
+        """
+        Render every frame missing from a face's atlas in the background
+
+        render(phoneme, emotion, intensity) returns encoded image bytes or None.
+        Returns a Future resolving to the number of frames in the atlas.
+        """
+        with self._lock:
+            building = self._building.get(face_hash)
+            if building is not None:
+                return building
+            future = Future()
+            self._building[face_hash] = future
+
+        def run():
+            try:
+                future.set_result(self._build(face_hash, render))
+            except Exception as e:
+                logger.error(f"Viseme atlas build for {face_hash[:12]} failed: {e}")
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._building.pop(face_hash, None)
+
+        threading.Thread(target=run, name='viseme-atlas-build', daemon=True).start()
+        return future
+
+    def _build(self, face_hash: str, render) -> int:
+        start = time.perf_counter()
+        frames = self._load(face_hash)
+        missing = [item for item in self.frame_keys() if frame_key(*item) not in frames]
+        if missing:
+            rendered = self._executor.map(lambda item: (frame_key(*item), render(*item)), missing)
+            new_frames = {key: image for key, image in rendered if image}
+            frames.update(new_frames)
+            self.frames_rendered += len(new_frames)
+            self._save(face_hash, frames)
+            self.sweep()
+            logger.info(f"Viseme atlas {face_hash[:12]}: rendered {len(new_frames)}/{len(missing)} frames "
+                        f"in {time.perf_counter() - start:.1f}s")
+
+        with self._lock:
+            self._remember(face_hash, frames)
+        return len(frames)
+
+    def is_complete(self, face_hash: str) -> bool:
+        with self._lock:
+            frames = self._atlases.get(face_hash) or {}
+        return all(frame_key(*item) in frames for item in self.frame_keys())
+
+    def sweep(self):
+        """Delete atlases beyond max_avatars (least recently used first) or unused for max_age_days"""
+        cutoff = time.time() - self.max_age_days * 86400
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.stat(path).st_mtime, name, path))
+            except OSError:
+                continue
+
+        entries.sort(reverse=True)
+        for position, (mtime, name, path) in enumerate(entries):
+            if position < self.max_avatars and mtime >= cutoff:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            self.evictions += 1
+            with self._lock:
+                self._atlases.pop(name, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'frames_per_avatar': len(PHONEMES) * len(self.emotions) * len(self.buckets),
+                'avatars_in_memory': len(self._atlases),
+                'building': len(self._building),
+                'hits': self.hits,
+                'misses': self.misses,
+                'frames_rendered': self.frames_rendered,
+                'evictions': self.evictions
+            }
+
+# Global atlas store, created on first use
+_viseme_atlas = LazySingleton(VisemeAtlasStore, 'viseme_atlas')
+
+def get_viseme_atlas():
+    """Get or create the global viseme atlas store"""
+    return _viseme_atlas.get()
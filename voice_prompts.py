@@ -0,0 +1,153 @@
+"""
+Voice prompt registry for CSM context segments
+Each speaker reference clip is decoded and resampled once per (path, mtime,
+target rate). Resampled audio is also saved as float32 .npy files that every
+worker process memory-maps, so the clips are shared rather than copied
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+import warnings
+from typing import Optional
+
+import numpy as np
+import torch
+import torchaudio
+
+from csm_integration import Segment
+from lazy_singleton import LazySingleton
+
+logger = logging.getLogger(__name__)
+
+VOICE_PROMPT_CACHE_DIR = os.environ.get('VOICE_PROMPT_CACHE_DIR', os.path.join('.cache', 'voice_prompts'))
+
+
+class VoicePromptRegistry:
+    """
+    Resampled reference clips and the Segments built from them
+
+    Entries are keyed by the clip's real path and the target sample rate and
+    remember the file's mtime; editing a clip replaces its entry on next use.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = VOICE_PROMPT_CACHE_DIR, use_mmap: bool = None):
+        self.cache_dir = cache_dir
+        self.use_mmap = use_mmap if use_mmap is not None else \
+            os.environ.get('VOICE_PROMPT_MMAP', '1').lower() not in ('0', 'false', 'no')
+
+        self._lock = threading.Lock()
+        # (path, rate) -> (mtime_ns, tensor)
+        self._audio = {}
+        # (path, rate, speaker, text) -> (mtime_ns, Segment)
+        self._segments = {}
+
+        self.hits = 0
+        self.mmap_loads = 0
+        self.decodes = 0
+
+        if self.use_mmap and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _array_path(self, path: str, mtime_ns: int, sample_rate: int) -> str:
+        digest = hashlib.sha1(f"{path}:{mtime_ns}:{sample_rate}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def _decode(self, path: str, sample_rate: int) -> torch.Tensor:
+        """torchaudio.load + resample to mono float32 at sample_rate"""
+        audio, orig_sample_rate = torchaudio.load(path)
+        audio = audio.mean(dim=0) if audio.shape[0] > 1 else audio.squeeze(0)
+        if orig_sample_rate != sample_rate:
+            audio = torchaudio.functional.resample(audio, orig_freq=orig_sample_rate, new_freq=sample_rate)
+        self.decodes += 1
+        return audio.to(torch.float32).contiguous()
+
+    def _load(self, path: str, mtime_ns: int, sample_rate: int) -> torch.Tensor:
+        """Map the shared .npy copy if another process made one, else decode (and publish) it"""
+        if not (self.use_mmap and self.cache_dir):
+            return self._decode(path, sample_rate)
+
+        array_path = self._array_path(path, mtime_ns, sample_rate)
+        if not os.path.exists(array_path):
+            audio = self._decode(path, sample_rate)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, audio.numpy())
+                os.replace(tmp_path, array_path)  # atomic: readers never see a partial file
+            except OSError as e:
+                logger.warning(f"Could not persist voice prompt {path}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return audio
+
+        array = np.load(array_path, mmap_mode='r')
+        self.mmap_loads += 1
+        with warnings.catch_warnings():
+            # Read-only on purpose: the pages are shared between processes
+            warnings.simplefilter('ignore', UserWarning)
+            return torch.from_numpy(array)
+
+    def get_audio(self, audio_path: str, sample_rate: int) -> torch.Tensor:
+        """Mono float32 audio of a reference clip at sample_rate"""
+        path = os.path.realpath(audio_path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        key = (path, sample_rate)
+
+        with self._lock:
+            entry = self._audio.get(key)
+            if entry is not None and entry[0] == mtime_ns:
+                self.hits += 1
+                return entry[1]
+
+            audio = self._load(path, mtime_ns, sample_rate)
+            if entry is not None:
+                self._forget(path, sample_rate, entry[0])
+            self._audio[key] = (mtime_ns, audio)
+            logger.info(f"Voice prompt loaded: {path} ({len(audio)} samples at {sample_rate} Hz)")
+            return audio
+
+    def _forget(self, path: str, sample_rate: int, mtime_ns: int):
+        """Drop state derived from an outdated version of a clip (lock held)"""
+        for key in [key for key in self._segments if key[:2] == (path, sample_rate)]:
+            del self._segments[key]
+        if self.use_mmap and self.cache_dir:
+            try:
+                # Processes that still map the old file keep their pages until they reload
+                os.remove(self._array_path(path, mtime_ns, sample_rate))
+            except OSError:
+                pass
+
+    def get_segment(self, text: str, speaker_id: int, audio_path: str, sample_rate: int) -> Segment:
+        """Context segment for a reference clip; a dictionary lookup after the first call"""
+        self.get_audio(audio_path, sample_rate)
+        path = os.path.realpath(audio_path)
+        key = (path, sample_rate, speaker_id, text)
+
+        with self._lock:
+            mtime_ns, audio = self._audio[(path, sample_rate)]
+            entry = self._segments.get(key)
+            if entry is None or entry[0] != mtime_ns:
+                entry = (mtime_ns, Segment(speaker=speaker_id, text=text, audio=audio))
+                self._segments[key] = entry
+            return entry[1]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'clips': len(self._audio),
+                'segments': len(self._segments),
+                'samples': sum(len(audio) for _, audio in self._audio.values()),
+                'hits': self.hits,
+                'mmap_loads': self.mmap_loads,
+                'decodes': self.decodes,
+                'mmap': self.use_mmap
+            }
+
+# Global registry, created on first use
+_voice_prompt_registry = LazySingleton(VoicePromptRegistry, 'voice_prompt_registry')
+
+def get_voice_prompt_registry():
+    """Get or create the global voice prompt registry"""
+    return _voice_prompt_registry.get()